@@ -14,3 +14,11 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Libary_management_system.settings')
 
 application = get_asgi_application()
+
+# imports and caches the first request would otherwise fill (baseApp/startup.py)
+from django.conf import settings  # noqa: E402
+
+if settings.WARM_UP_ON_START:
+    from baseApp.startup import warm_up
+
+    warm_up()
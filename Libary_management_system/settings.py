@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,6 +46,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    # compresses what every middleware below has produced
+    "baseApp.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -84,6 +87,98 @@ DATABASES = {
 }
 
 
+# Caches shared by every worker process, so what one process stores or invalidates
+# (book availability, the fine rules version) is seen by all of them. Redis when
+# LIBRARY_REDIS_URL is set (needs the redis package), otherwise files under
+# .cache/, shared by the processes on this host. A file cache keeps at most 300
+# entries and deletes a random third when full, so the fine rules version has an
+# alias of its own that holds nothing else. Book availability (two entries per
+# book) is only cached in Redis: a file cache lists its whole directory on every
+# write and could not hold the books of one lookup, so without Redis every
+# lookup is one indexed query. Tests use private in-memory caches
+# (baseApp/test_runner.py).
+if os.environ.get("LIBRARY_REDIS_URL"):
+    CACHES = {
+        alias: {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["LIBRARY_REDIS_URL"],
+        }
+        for alias in ("default", "fines", "availability")
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": BASE_DIR / ".cache",
+        },
+        "fines": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": BASE_DIR / ".cache" / "fines",
+        },
+        "availability": {
+            "BACKEND": "django.core.cache.backends.dummy.DummyCache",
+        },
+    }
+
+
+# Migrated SQLite snapshots, cloned for test runs and throwaway environments
+# (see baseApp/snapshot.py and the db_snapshot command)
+DB_SNAPSHOT_DIR = BASE_DIR / ".db_snapshots"
+
+TEST_RUNNER = "baseApp.test_runner.SnapshotTestRunner"
+
+# Login under load (baseApp/logins.py): failed attempts per username before it is
+# locked out for the window, and the password checks that may run at once (plus
+# how many may wait for them before logins are refused with 503)
+LOGIN_MAX_FAILURES = 5
+LOGIN_FAILURE_WINDOW = 5 * 60
+LOGIN_HASH_WORKERS = os.cpu_count() or 1
+LOGIN_HASH_QUEUE = 64
+# seconds a user's token key is kept in the cache after a login
+LOGIN_TOKEN_CACHE_TTL = 5 * 60
+
+# Idempotency-Key header (baseApp/idempotency.py): how long a stored response
+# is replayed, and how long a retry waits for the first request to finish
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_WAIT = 10
+
+# Responses smaller than this many bytes are not compressed (baseApp.middleware)
+RESPONSE_COMPRESSION_MIN_SIZE = 1024
+
+# Change feed (/changes/): next_cursor only moves past entries at least this many
+# seconds old. Must be longer than any transaction that writes the change log,
+# or an entry committed late (with a lower id) can be skipped by mirrors.
+CHANGE_FEED_SETTLE_SECONDS = 30
+
+# Seconds a book's entry stays in the availability cache (/books/availability/)
+AVAILABILITY_CACHE_TTL = 60
+
+# In-memory typeahead index (/books/typeahead/). The entry limit bounds its
+# memory; the first build runs in a background thread unless this is False.
+TYPEAHEAD_MAX_ENTRIES = 3_000_000
+TYPEAHEAD_BUILD_IN_BACKGROUND = True
+
+# manage.py archive_loans moves loans returned more than this many days ago out of BorrowRecord
+ARCHIVE_LOANS_AFTER_DAYS = 365
+
+# Co-borrow matrix kept between runs of manage.py build_recommendations, and how
+# many loan ids below its watermark every run reads again: ids are not handed out
+# in commit order, so a loan committed just after a run can have a lower id.
+RECOMMENDATIONS_MATRIX = BASE_DIR / ".recommendations" / "coborrow.npz"
+RECOMMENDATIONS_REREAD_LOANS = 1000
+
+# Late fees for genres without their own FineRule
+FINE_DEFAULT_RULE = {
+    "daily_rate": "0.25",
+    "grace_days": 0,
+    "cap": "10.00",  # None for no limit
+}
+
+# Emails (overdue reminders) are printed to the console during development
+EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
+DEFAULT_FROM_EMAIL = "library@example.com"
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -148,3 +243,33 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10,  # Default items per page
 
 }
+
+# API-only workers (LIBRARY_API_ONLY=1): clients use token auth and JSON, so the
+# admin site, sessions, messages, static files and the browsable API are left
+# out, and neither imported nor run on each request. Run the admin from a
+# separate process without the variable.
+API_ONLY = os.environ.get("LIBRARY_API_ONLY") == "1"
+if API_ONLY:
+    INSTALLED_APPS = [
+        app for app in INSTALLED_APPS
+        if app not in {
+            "django.contrib.admin",
+            "django.contrib.sessions",
+            "django.contrib.messages",
+            "django.contrib.staticfiles",
+        }
+    ]
+    MIDDLEWARE = [
+        middleware for middleware in MIDDLEWARE
+        if middleware not in {
+            "django.contrib.sessions.middleware.SessionMiddleware",
+            "django.middleware.csrf.CsrfViewMiddleware",  # DRF views are csrf exempt without sessions
+            "django.contrib.auth.middleware.AuthenticationMiddleware",  # DRF authenticates the token
+            "django.contrib.messages.middleware.MessageMiddleware",
+        }
+    ]
+    TEMPLATES[0]["OPTIONS"]["context_processors"] = ["django.template.context_processors.request"]
+    REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"] = ["rest_framework.renderers.JSONRenderer"]
+
+# Work done in wsgi.py/asgi.py before a worker takes requests (baseApp/startup.py)
+WARM_UP_ON_START = True
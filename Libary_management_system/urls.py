@@ -15,7 +15,7 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 from baseApp.views import (
@@ -25,15 +25,42 @@ from baseApp.views import (
     UserApiView,
     GroupApiViewSet,
     MemberApiViewSet,
+    ReservationViewSet,
+    ChangeFeedViewSet,
+    FineViewSet,
+    FineRuleViewSet,
+    login,
 )
 
 router = DefaultRouter()
 router.register(r"genres", GenreApiViewSet, basename="genre")
 router.register(r"books", BookAPiViewSet, basename="book")
 router.register(r"borrow-records", BorrowRecordViewSet, basename="borrowrecord")
+router.register(r"holds", ReservationViewSet, basename="hold")
+router.register(r"fine-rules", FineRuleViewSet, basename="finerule")
 
 urlpatterns = [
-    path("admin/", admin.site.urls),
+    # Custom routes for Book
+    path(
+        "books/availability/",
+        BookAPiViewSet.as_view({"get": "availability", "post": "availability"}),
+        name="book-availability",
+    ),
+    path(
+        "books/inventory/",
+        BookAPiViewSet.as_view({"patch": "inventory"}),
+        name="book-inventory",
+    ),
+    path(
+        "books/typeahead/",
+        BookAPiViewSet.as_view({"get": "typeahead"}),
+        name="book-typeahead",
+    ),
+    path(
+        "books/<int:pk>/recommendations/",
+        BookAPiViewSet.as_view({"get": "recommendations"}),
+        name="book-recommendations",
+    ),
     # Custom routes for BorrowRecord
     path(
         "borrow-records/<int:pk>/return/",
@@ -50,9 +77,31 @@ urlpatterns = [
         BorrowRecordViewSet.as_view({"get": "overdue"}),
         name="borrowrecord-overdue-list",
     ),
-    path("register/", UserApiView.as_view({"post": "register"})),
-    path("login/", UserApiView.as_view({"post": "login"})),
-    path("groups/", GroupApiViewSet.as_view({"get": "list"})),
-    path("members/", MemberApiViewSet.as_view({"get": "list"})),
-    path("members/<int:pk>/", MemberApiViewSet.as_view({"get": "retrieve"})),
+    path(
+        "borrow-records/history/",
+        BorrowRecordViewSet.as_view({"get": "history"}),
+        name="borrowrecord-history",
+    ),
+    # Custom route for holds
+    path(
+        "holds/<int:pk>/position/",
+        ReservationViewSet.as_view({"get": "position"}),
+        name="hold-position",
+    ),
+    # Late fees
+    path("fines/", FineViewSet.as_view({"get": "list"}), name="fine-list"),
+    path("fines/members/<int:pk>/", FineViewSet.as_view({"get": "member"}), name="fine-member"),
+    path("fines/records/<int:pk>/", FineViewSet.as_view({"get": "record"}), name="fine-record"),
+    path("changes/", ChangeFeedViewSet.as_view({"get": "list"}), name="change-feed"),
+    path("register/", UserApiView.as_view({"post": "register"}), name="register"),
+    path("login/", login, name="login"),
+    path("groups/", GroupApiViewSet.as_view({"get": "list"}), name="group-list"),
+    path("members/", MemberApiViewSet.as_view({"get": "list"}), name="member-list"),
+    path("members/<int:pk>/", MemberApiViewSet.as_view({"get": "retrieve"}), name="member-detail"),
 ] + router.urls
+
+# not installed on API-only workers (settings.API_ONLY)
+if apps.is_installed("django.contrib.admin"):
+    from django.contrib import admin
+
+    urlpatterns.insert(0, path("admin/", admin.site.urls))
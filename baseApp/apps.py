@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class BaseappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'baseApp'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (connects the receivers)
+        from . import tasks  # noqa: F401  (registers the background tasks)
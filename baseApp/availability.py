@@ -0,0 +1,107 @@
+"""
+Short-lived cache of book availability for bulk lookups by id or ISBN.
+
+Every book is cached under two keys, its id and its ISBN, holding
+(id, isbn, available_copies, total_copies). Saving a book (lending,
+returning, editing) writes the new values after the transaction commits,
+so the entries stay current between expiries and repeated lookups do not
+touch the database.
+
+Entries live in the "availability" cache (settings.CACHES), so what one
+worker writes after a loan is read by all the others. A change that bypasses
+both save() and refresh() (raw SQL, another program writing to the database)
+shows up once the entry expires, after at most AVAILABILITY_CACHE_TTL seconds.
+Only Redis can hold that many entries; without it the alias caches nothing
+and every lookup runs its one query.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Book
+
+
+TTL = getattr(settings, "AVAILABILITY_CACHE_TTL", 60)
+# Cached for ids and ISBNs that matched no book; saving a new book replaces it.
+NOT_FOUND = ()
+FIELDS = ("id", "isbn", "available_copies", "total_copies")
+
+
+def id_key(book_id):
+    return f"availability:id:{book_id}"
+
+
+def isbn_key(isbn):
+    return f"availability:isbn:{isbn}"
+
+
+def entries(rows):
+    """
+    Cache entries for (id, isbn, available_copies, total_copies) rows.
+    """
+    cached = {}
+    for row in rows:
+        cached[id_key(row[0])] = cached[isbn_key(row[1])] = tuple(row)
+    return cached
+
+
+def store(*books):
+    """
+    Puts the current values of the given books in the cache.
+    """
+    caches["availability"].set_many(entries(
+        (book.pk, book.isbn, book.available_copies, book.total_copies) for book in books
+    ), timeout=TTL)
+
+
+def forget(*books):
+    caches["availability"].delete_many([key for book in books for key in (id_key(book.pk), isbn_key(book.isbn))])
+
+
+def refresh(ids):
+    """
+    Reloads the given books with one query, for changes made with
+    QuerySet.update() that bypass save().
+    """
+    caches["availability"].set_many(entries(Book.objects.filter(pk__in=ids).values_list(*FIELDS)), timeout=TTL)
+
+
+def lookup(ids=(), isbns=()):
+    """
+    Returns {"ids": {id: row}, "isbns": {isbn: row}} for the books found.
+    Cache misses are loaded together in one query on the primary key and the
+    unique isbn index, then cached.
+    """
+    keys = {id_key(book_id): ("ids", book_id) for book_id in ids}
+    keys.update({isbn_key(isbn): ("isbns", isbn) for isbn in isbns})
+    cache = caches["availability"]
+    cached = cache.get_many(keys)
+
+    found = {"ids": {}, "isbns": {}}
+    missing = {"ids": [], "isbns": []}
+    for key, (kind, value) in keys.items():
+        row = cached.get(key)
+        if row == NOT_FOUND:
+            continue
+        # an ISBN key can outlive a change of the book's ISBN
+        if row is not None and (kind == "ids" or row[1] == value):
+            found[kind][value] = row
+        else:
+            missing[kind].append(value)
+
+    if missing["ids"] or missing["isbns"]:
+        rows = list(
+            Book.objects.filter(pk__in=missing["ids"]).values_list(*FIELDS).union(
+                Book.objects.filter(isbn__in=missing["isbns"]).values_list(*FIELDS)
+            )
+        )
+        wanted_ids, wanted_isbns = set(missing["ids"]), set(missing["isbns"])
+        for row in rows:
+            if row[0] in wanted_ids:
+                found["ids"][row[0]] = row
+            if row[1] in wanted_isbns:
+                found["isbns"][row[1]] = row
+        loaded = entries(rows)
+        loaded.update({id_key(book_id): NOT_FOUND for book_id in wanted_ids - found["ids"].keys()})
+        loaded.update({isbn_key(isbn): NOT_FOUND for isbn in wanted_isbns - found["isbns"].keys()})
+        cache.set_many(loaded, timeout=TTL)
+    return found
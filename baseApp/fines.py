@@ -0,0 +1,198 @@
+"""
+Late fee calculation.
+
+All outstanding fines are computed in one pass over the open, late loans:
+a single query fetches (record, member, genre, due date) as columns, and the
+fee formula runs on whole arrays at once (NumPy when installed, plain Python
+otherwise). The result is kept per day in the process, so the API endpoints
+only look values up. Changing a FineRule starts a new computation; loans and
+returns do not (see signals.invalidate_fines).
+"""
+import threading
+import uuid
+from bisect import bisect_left
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .models import ACTIVE_STATUSES, BorrowRecord, FineRule
+
+
+RULES_VERSION_KEY = "fines:rules-version"
+NO_CAP = 2 ** 62
+
+_lock = threading.Lock()
+_snapshot = None
+
+
+def numpy():
+    """
+    NumPy when installed, imported on the first computation rather than
+    with this module: every process imports fines, few of them compute.
+    """
+    try:
+        import numpy
+    except ImportError:  # optional, the pure Python path gives the same results
+        return None
+    return numpy
+
+
+def to_cents(value):
+    return int(Decimal(str(value)) * 100)
+
+
+def from_cents(cents):
+    return f"{Decimal(cents) / 100:.2f}"
+
+
+def rules_version():
+    cache = caches["fines"]
+    version = cache.get(RULES_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.add(RULES_VERSION_KEY, version, timeout=None)
+        version = cache.get(RULES_VERSION_KEY, version)
+    return version
+
+
+def invalidate():
+    """
+    Makes every process recompute on its next lookup (called when rules change).
+    The version lives in the shared "fines" cache (settings.CACHES), so one
+    write reaches all workers, and nothing else stored there can push it out.
+    """
+    caches["fines"].set(RULES_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+class FineSnapshot:
+    """
+    Fines of all late open loans on one day, sorted for O(log n) lookups.
+    Amounts are in cents.
+    """
+
+    def __init__(self, day, version, record_ids, member_ids, days_late, amounts):
+        self.day = day
+        self.version = version
+
+        by_record = sorted(range(len(record_ids)), key=record_ids.__getitem__)
+        self.record_ids = [record_ids[i] for i in by_record]
+        self.record_members = [member_ids[i] for i in by_record]
+        self.record_days = [days_late[i] for i in by_record]
+        self.record_amounts = [amounts[i] for i in by_record]
+
+        # per member: total and the positions of their records
+        self.members = {}
+        for position, member in enumerate(self.record_members):
+            entry = self.members.setdefault(member, [0, []])
+            entry[0] += self.record_amounts[position]
+            entry[1].append(position)
+        self.balances = sorted(
+            ((member, total, len(positions)) for member, (total, positions) in self.members.items()),
+            key=lambda balance: (-balance[1], balance[0]),
+        )
+
+    def _record(self, position):
+        return {
+            "record": self.record_ids[position],
+            "member": self.record_members[position],
+            "days_late": self.record_days[position],
+            "amount": from_cents(self.record_amounts[position]),
+        }
+
+    def for_record(self, record_id):
+        position = bisect_left(self.record_ids, record_id)
+        if position < len(self.record_ids) and self.record_ids[position] == record_id:
+            return self._record(position)
+        return {"record": record_id, "member": None, "days_late": 0, "amount": from_cents(0)}
+
+    def for_member(self, member_id):
+        total, positions = self.members.get(member_id, (0, []))
+        return {
+            "member": member_id,
+            "total": from_cents(total),
+            "records": [self._record(position) for position in positions],
+        }
+
+    def balance_list(self):
+        return [
+            {"member": member, "total": from_cents(total), "records": count}
+            for member, total, count in self.balances
+        ]
+
+
+def load_rules():
+    """
+    Returns rate, grace and cap lookup lists indexed by genre id.
+    Index 0 holds the default rule (books without a genre).
+    """
+    default = settings.FINE_DEFAULT_RULE
+    default_rule = (
+        to_cents(default["daily_rate"]),
+        int(default.get("grace_days", 0)),
+        NO_CAP if default.get("cap") is None else to_cents(default["cap"]),
+    )
+    rules = {
+        genre_id: (to_cents(rate), grace, NO_CAP if cap is None else to_cents(cap))
+        for genre_id, rate, grace, cap in FineRule.objects.values_list("genre_id", "daily_rate", "grace_days", "cap")
+    }
+    size = max(rules, default=0) + 1
+    rate, grace, cap = ([default_rule[i]] * size for i in range(3))
+    for genre_id, (genre_rate, genre_grace, genre_cap) in rules.items():
+        rate[genre_id], grace[genre_id], cap[genre_id] = genre_rate, genre_grace, genre_cap
+    return rate, grace, cap
+
+
+def compute(day=None, version=None):
+    """
+    Computes the fines of every open loan that is past its due date on `day`.
+    """
+    day = day or timezone.now().date()
+    rate, grace, cap = load_rules()
+    rows = list(
+        BorrowRecord.objects.filter(status__in=ACTIVE_STATUSES, due_date__lt=day)
+        .values_list("id", "member_id", "book__genre_id", "due_date")
+    )
+    record_ids = [row[0] for row in rows]
+    member_ids = [row[1] for row in rows]
+    genres = [row[2] if row[2] is not None and row[2] < len(rate) else 0 for row in rows]
+    due = [row[3].toordinal() for row in rows]
+    today = day.toordinal()
+
+    np = numpy()
+    if np is not None:
+        genres = np.asarray(genres, dtype=np.int64)
+        days_late = np.maximum(today - np.asarray(due, dtype=np.int64) - np.asarray(grace)[genres], 0)
+        amounts = np.minimum(days_late * np.asarray(rate)[genres], np.asarray(cap)[genres])
+        charged = np.flatnonzero(amounts)
+        record_ids = np.asarray(record_ids, dtype=np.int64)[charged].tolist()
+        member_ids = np.asarray(member_ids, dtype=np.int64)[charged].tolist()
+        days_late = days_late[charged].tolist()
+        amounts = amounts[charged].tolist()
+    else:
+        days_late = [max(today - d - grace[g], 0) for d, g in zip(due, genres)]
+        amounts = [min(late * rate[g], cap[g]) for late, g in zip(days_late, genres)]
+        charged = [i for i, amount in enumerate(amounts) if amount]
+        record_ids = [record_ids[i] for i in charged]
+        member_ids = [member_ids[i] for i in charged]
+        days_late = [days_late[i] for i in charged]
+        amounts = [amounts[i] for i in charged]
+
+    return FineSnapshot(day, version, record_ids, member_ids, days_late, amounts)
+
+
+def current():
+    """
+    Today's snapshot, computed at most once per day and rules version per process.
+    """
+    global _snapshot
+    day = timezone.now().date()
+    version = rules_version()
+    snapshot = _snapshot
+    if snapshot is None or snapshot.day != day or snapshot.version != version:
+        with _lock:
+            snapshot = _snapshot
+            if snapshot is None or snapshot.day != day or snapshot.version != version:
+                snapshot = _snapshot = compute(day, version)
+    return snapshot
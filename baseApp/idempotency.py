@@ -0,0 +1,147 @@
+"""
+Idempotency-Key support for the write endpoints that clients retry.
+
+The first request with a key claims an IdempotencyKey row before the view
+runs and stores the response when it is done. Keys belong to the user
+(anonymous requests to the client address). A retry with the same key gets
+the stored response back, with an Idempotent-Replayed header, without
+running the view again. A retry that arrives while the first request still
+runs waits for its response instead of running in parallel. A key reused
+for a different request gets 422.
+
+Errors (exceptions and 5xx responses) are not stored, so a retry after a
+failure runs the view again.
+"""
+import functools
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+STALE_AFTER = timedelta(minutes=1)  # an unfinished entry this old belongs to a request that died
+
+
+def scope_for(request):
+    """
+    The user's keys, or for anonymous requests (registration) the keys of
+    the client address, so two clients cannot share one key by accident.
+    """
+    user = request.user
+    if user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"anon:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def fingerprint(request):
+    """
+    Keyed with SECRET_KEY (HMAC-SHA256): bodies can hold passwords, and a
+    plain hash stored in the table could be cracked offline.
+    """
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    return salted_hmac(
+        "baseApp.idempotency", f"{request.method} {request.path}\n{body}", algorithm="sha256",
+    ).hexdigest()
+
+
+def claim(scope, key, digest):
+    """
+    Returns (entry, created). An expired or stale entry is taken over as if it were new.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    try:
+        with transaction.atomic():
+            entry = IdempotencyKey.objects.create(scope=scope, key=key, fingerprint=digest, expires_at=expires_at)
+        return entry, True
+    except IntegrityError:
+        pass
+    free = Q(expires_at__lte=now) | Q(status_code__isnull=True, created_at__lte=now - STALE_AFTER)
+    taken = IdempotencyKey.objects.filter(free, scope=scope, key=key).update(
+        fingerprint=digest, status_code=None, response=None, created_at=now, expires_at=expires_at,
+    )
+    return IdempotencyKey.objects.filter(scope=scope, key=key).first(), bool(taken)
+
+
+def wait_for(scope, key, digest):
+    """
+    Claims the key, or waits up to settings.IDEMPOTENCY_WAIT seconds for
+    the request holding it to finish. Returns (entry, created); entry is
+    None when the key was released (the request holding it failed) and
+    taken again by another request every time this one tried.
+    """
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+    delay = 0.05
+    while True:
+        entry, created = claim(scope, key, digest)
+        if created:
+            return entry, True
+        if entry is not None and (entry.fingerprint != digest or entry.status_code is not None):
+            return entry, False
+        if time.monotonic() >= deadline:
+            return entry, False
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+
+def idempotent(view_method):
+    """
+    Decorator for viewset actions: honours the Idempotency-Key header.
+    """
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {"detail": f"{HEADER} may be at most {MAX_KEY_LENGTH} characters."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        digest = fingerprint(request)
+        entry, created = wait_for(scope_for(request), key, digest)
+        if not created:
+            if entry is not None and entry.fingerprint != digest:
+                return Response(
+                    {"detail": f"This {HEADER} was already used for a different request."},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            if entry is None or entry.status_code is None:
+                response = Response(
+                    {"detail": f"A request with this {HEADER} is still being processed."},
+                    status=status.HTTP_409_CONFLICT,
+                )
+                response["Retry-After"] = "1"
+                return response
+            response = Response(entry.response, status=entry.status_code)
+            response["Idempotent-Replayed"] = "true"
+            return response
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            IdempotencyKey.objects.filter(pk=entry.pk).delete()
+            raise
+        if response.status_code >= 500:
+            IdempotencyKey.objects.filter(pk=entry.pk).delete()
+        else:
+            IdempotencyKey.objects.filter(pk=entry.pk).update(
+                status_code=response.status_code, response=response.data,
+            )
+        return response
+
+    return wrapper
@@ -0,0 +1,179 @@
+"""
+Lightweight background job queue stored in the project's database.
+
+    from baseApp.jobs import enqueue
+    enqueue("send_overdue_reminders")                       # as soon as a worker is free
+    enqueue("mark_overdue", run_at=tomorrow_morning)        # scheduled
+
+Tasks are plain functions registered with @task (see baseApp/tasks.py) and run
+by `python manage.py run_jobs`.
+"""
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+
+TASKS = {}
+
+# Seconds before the first retry; doubled for every further attempt.
+RETRY_BACKOFF = getattr(settings, "JOBS_RETRY_BACKOFF", 30)
+# RUNNING jobs whose worker has not refreshed locked_at for this many seconds
+# are assumed lost with it.
+STALE_AFTER = getattr(settings, "JOBS_STALE_AFTER", 15 * 60)
+# Seconds between refreshes of locked_at while a job runs, well below STALE_AFTER.
+HEARTBEAT = getattr(settings, "JOBS_HEARTBEAT", 60)
+
+
+def task(name=None):
+    """
+    Registers a function as a task that can be enqueued by name.
+    """
+    def register(func):
+        TASKS[name or func.__name__] = func
+        return func
+    return register
+
+
+def enqueue(name, payload=None, run_at=None, delay=None, max_attempts=5):
+    """
+    Adds a job to the queue. run_at (a datetime) or delay (seconds or a
+    timedelta) schedules it for later; otherwise it runs as soon as possible.
+    The job is only visible to workers once the surrounding transaction commits.
+    """
+    if name not in TASKS:
+        raise ValueError(f"Unknown task: {name}")
+    if run_at is None:
+        run_at = timezone.now()
+        if delay:
+            run_at += delay if isinstance(delay, timedelta) else timedelta(seconds=delay)
+    return Job.objects.create(name=name, payload=payload or {}, run_at=run_at, max_attempts=max_attempts)
+
+
+def claim(worker, limit):
+    """
+    Marks up to `limit` due jobs as RUNNING for this worker and returns them.
+    Uses SELECT ... FOR UPDATE SKIP LOCKED where the backend has it, so
+    workers never wait on each other's rows. Elsewhere (SQLite) a conditional
+    UPDATE on status decides which worker gets a job.
+    """
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by("run_at", "id")
+    claimed = dict(status=Job.RUNNING, locked_by=worker, locked_at=now, attempts=F("attempts") + 1)
+
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            ids = list(due.select_for_update(skip_locked=True).values_list("id", flat=True)[:limit])
+            Job.objects.filter(pk__in=ids).update(**claimed)
+        else:
+            ids = list(due.values_list("id", flat=True)[:limit])
+            Job.objects.filter(pk__in=ids, status=Job.QUEUED).update(**claimed)
+        return list(Job.objects.filter(pk__in=ids, status=Job.RUNNING, locked_by=worker, locked_at=now))
+
+
+def claimed_by(job):
+    """
+    The job's row, as long as it is still running under this claim. A job
+    requeued as stale and claimed again has a new attempt number.
+    """
+    return Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by, attempts=job.attempts)
+
+
+def touch(job):
+    """
+    Refreshes locked_at of a running job. Returns False when the claim was lost.
+    """
+    return bool(claimed_by(job).update(locked_at=timezone.now()))
+
+
+@contextmanager
+def heartbeat(job):
+    """
+    Touches the job every HEARTBEAT seconds from a background thread while
+    the block runs, so a long job is not requeued as stale.
+    """
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(HEARTBEAT):
+                if not touch(job):
+                    return
+        finally:
+            connection.close()  # the thread's own connection
+
+    thread = threading.Thread(target=beat, name=f"job-{job.pk}-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run(job):
+    """
+    Runs one claimed job and records the outcome: DONE, QUEUED again with
+    a backoff delay, or FAILED once max_attempts is reached. Returns None,
+    recording nothing, when the claim was lost meanwhile (the job was
+    requeued as stale and is another worker's now).
+    """
+    try:
+        with heartbeat(job):
+            TASKS[job.name](**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+        else:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + timedelta(seconds=RETRY_BACKOFF * 2 ** (job.attempts - 1))
+    else:
+        job.status = Job.DONE
+        job.finished_at = timezone.now()
+    recorded = claimed_by(job).update(
+        status=job.status, run_at=job.run_at, last_error=job.last_error,
+        finished_at=job.finished_at, locked_by="", locked_at=None,
+    )
+    if not recorded:
+        return None
+    job.locked_by = ""
+    job.locked_at = None
+    return job.status
+
+
+def run_by_id(job_id):
+    """
+    Entry point for pool workers: loads the claimed job in the worker's own
+    database connection and runs it.
+    """
+    from django.db import close_old_connections
+
+    close_old_connections()
+    try:
+        return run(Job.objects.get(pk=job_id))
+    finally:
+        close_old_connections()
+
+
+def requeue_stale():
+    """
+    Puts RUNNING jobs whose worker died back in the queue. A job that has
+    used all its attempts is marked FAILED instead, so one that keeps
+    crashing its worker is not retried forever. Returns the number requeued.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=now - timedelta(seconds=STALE_AFTER))
+    stale.filter(attempts__gte=F("max_attempts")).update(
+        status=Job.FAILED, finished_at=now, locked_by="", locked_at=None,
+        last_error="The worker running this job stopped responding.",
+    )
+    return stale.update(status=Job.QUEUED, locked_by="", locked_at=None)
@@ -0,0 +1,167 @@
+"""
+Login under load.
+
+- Failed attempts are counted per username in process memory. After
+  LOGIN_MAX_FAILURES within LOGIN_FAILURE_WINDOW seconds the username is
+  refused before any password hashing, which is what a brute-force storm
+  would otherwise spend the CPU on.
+- At most LOGIN_HASH_WORKERS password checks run at once (PBKDF2 releases
+  the GIL, so they use separate cores), and when LOGIN_HASH_QUEUE more are
+  already waiting the login is refused with 503 instead of piling up.
+- Credentials are checked with authenticate(), so every backend in
+  AUTHENTICATION_BACKENDS and the user_login_failed signal still run.
+- The user -> token key mapping is kept in the shared cache for
+  LOGIN_TOKEN_CACHE_TTL seconds, so a repeated login does not read the
+  token table. signals.py drops the entry when the token is deleted.
+
+/login/ is an async view. authenticate() runs on a pool thread of its own
+(thread_sensitive=False), so under ASGI a slow hash does not hold up the
+single thread Django runs sync views on, and under WSGI checks for
+different logins still run in parallel.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.core.cache import cache
+from rest_framework.authtoken.models import Token
+
+
+MAX_TRACKED = 100_000  # usernames with recent failures kept in memory
+
+_attempts = OrderedDict()  # username -> [failures, time of the first one, checks running]
+_attempts_lock = threading.Lock()
+_running = None
+_admitted = None
+_gates_lock = threading.Lock()
+
+
+def _key(username):
+    return username.strip().lower()
+
+
+def begin(username):
+    """
+    Registers a login attempt. Returns 0 when it may go ahead, or the
+    seconds until the username may try again. Checks still running count
+    as failures, so a burst of guesses cannot start more hashes than
+    LOGIN_MAX_FAILURES before the first results are in.
+    """
+    now = time.monotonic()
+    key = _key(username)
+    with _attempts_lock:
+        entry = _attempts.pop(key, None) or [0, now, 0]
+        if entry[0] and now - entry[1] > settings.LOGIN_FAILURE_WINDOW:
+            entry[0], entry[1] = 0, now
+        _attempts[key] = entry
+        while len(_attempts) > MAX_TRACKED:
+            _attempts.popitem(last=False)
+        if entry[0] >= settings.LOGIN_MAX_FAILURES:
+            return int(entry[1] + settings.LOGIN_FAILURE_WINDOW - now) + 1
+        if entry[0] + entry[2] >= settings.LOGIN_MAX_FAILURES:
+            return 1  # decided once the running checks finish
+        entry[2] += 1
+        return 0
+
+
+def end(username, success):
+    """
+    Records the outcome of an attempt begin() let through (None when it
+    was not decided, e.g. too many checks were waiting).
+    """
+    key = _key(username)
+    with _attempts_lock:
+        entry = _attempts.get(key)
+        if entry is None:
+            return
+        entry[2] = max(entry[2] - 1, 0)
+        if success:
+            entry[0] = 0
+        elif success is False:
+            if not entry[0]:
+                entry[1] = time.monotonic()
+            entry[0] += 1
+        if not entry[0] and not entry[2]:
+            del _attempts[key]
+
+
+def reset():
+    with _attempts_lock:
+        _attempts.clear()
+
+
+def _gates():
+    """
+    (checks allowed to run, checks allowed to run or wait), created on first use.
+    """
+    global _running, _admitted
+    if _admitted is None:
+        with _gates_lock:
+            if _admitted is None:
+                workers = settings.LOGIN_HASH_WORKERS
+                _running = threading.BoundedSemaphore(workers)
+                _admitted = threading.BoundedSemaphore(workers + settings.LOGIN_HASH_QUEUE)
+    return _running, _admitted
+
+
+async def login(request, username, password):
+    """
+    Returns (user, retry_after). retry_after > 0 means the username is
+    locked out and nothing was checked. Otherwise user is as in
+    check_credentials().
+    """
+    wait = begin(username)
+    if wait:
+        return None, wait
+    user = None
+    try:
+        user = await check_credentials(request, username, password)
+    finally:
+        end(username, None if user is None else bool(user))
+    return user, 0
+
+
+async def check_credentials(request, username, password):
+    """
+    The active user with these credentials, False for wrong ones, or None
+    when too many checks are already waiting. As with authenticate(), an
+    unknown username still costs one hash, so it cannot be told apart by timing.
+    """
+    running, admitted = _gates()
+    if not admitted.acquire(blocking=False):
+        return None
+    try:
+        user = await sync_to_async(_authenticate, thread_sensitive=False)(running, request, username, password)
+    finally:
+        admitted.release()
+    return user or False
+
+
+def _authenticate(running, request, username, password):
+    # waits for a free slot on the pool thread, never on the event loop
+    with running:
+        return authenticate(request, username=username, password=password)
+
+
+def token_cache_key(user_id):
+    return f"login:token:{user_id}"
+
+
+def token_for(user):
+    """
+    The user's token key, from the cache when a recent login stored it.
+    The timeout bounds how long a token deleted without the post_delete
+    signal (e.g. with raw SQL) can still be handed out.
+    """
+    key = cache.get(token_cache_key(user.pk))
+    if key is None:
+        key = Token.objects.get_or_create(user=user)[0].key
+        cache.set(token_cache_key(user.pk), key, timeout=settings.LOGIN_TOKEN_CACHE_TTL)
+    return key
+
+
+def forget_token(user_id):
+    cache.delete(token_cache_key(user_id))
@@ -0,0 +1,33 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from baseApp.models import ArchivedBorrowRecord
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves RETURNED borrow records older than --days from the BorrowRecord "
+        "table into the archive, in batched transactions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=settings.ARCHIVE_LOANS_AFTER_DAYS,
+            help="Archive loans returned more than N days ago.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options["days"] < 0 or options["batch_size"] < 1:
+            raise CommandError("--days cannot be negative and --batch-size must be at least 1.")
+        started = time.perf_counter()
+        archived = ArchivedBorrowRecord.archive(
+            timezone.now().date() - timedelta(days=options["days"]), options["batch_size"]
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {archived} borrow records in {time.perf_counter() - started:.2f}s."
+        ))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from baseApp import recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Updates the \"patrons also borrowed\" recommendations from the loans made "
+        "since the last run, or from all loans with --full."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Rebuild the co-borrow matrix from every loan.")
+        parser.add_argument("--top", type=int, default=recommendations.TOP_K, help="Recommendations kept per book.")
+        parser.add_argument(
+            "--min-count", type=int, default=recommendations.MIN_COUNT,
+            help="Members two books need in common to be recommended together.",
+        )
+
+    def handle(self, *args, **options):
+        if options["top"] < 1 or options["min_count"] < 1:
+            raise CommandError("--top and --min-count must be at least 1.")
+        started = time.perf_counter()
+        try:
+            loans, books, rows = recommendations.build(options["full"], options["top"], options["min_count"])
+        except ImportError as exc:
+            raise CommandError(exc)
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {loans} loans, updated {books} books ({rows} recommendations) "
+            f"in {time.perf_counter() - started:.2f}s."
+        ))
@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from baseApp.models import ChangeLog
+
+
+class Command(BaseCommand):
+    help = (
+        "Compacts the change feed: entries older than --days that a newer entry "
+        "of the same object replaces are deleted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30, help="Keep every entry of the last N days.")
+
+    def handle(self, *args, **options):
+        if options["days"] < 0:
+            raise CommandError("--days cannot be negative.")
+        deleted = ChangeLog.compact(timezone.now() - timedelta(days=options["days"]))
+        self.stdout.write(self.style.SUCCESS(f"Removed {deleted} superseded change log entries."))
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from baseApp.snapshot import build_snapshot, clone_snapshot, snapshot_path
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds a migrated (optionally seeded) SQLite snapshot once and clones it "
+        "into a new database file with the SQLite backup API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["build", "clone", "path"])
+        parser.add_argument("target", nargs="?", help="Database file to create (clone only).")
+        parser.add_argument("--rebuild", action="store_true", help="Build again even if the snapshot exists.")
+        # seed_library options; without --records/--books/--members the snapshot is empty
+        parser.add_argument("--books", type=int, default=0)
+        parser.add_argument("--members", type=int, default=0)
+        parser.add_argument("--records", type=int, default=0)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        seed_options = None
+        if options["books"] or options["members"] or options["records"]:
+            seed_options = {
+                "books": options["books"],
+                "members": options["members"],
+                "records": options["records"],
+                "seed": options["seed"],
+            }
+        path = snapshot_path(seed_options)
+
+        if options["action"] == "path":
+            self.stdout.write(str(path))
+            return
+
+        if options["rebuild"] or not path.exists():
+            started = time.perf_counter()
+            try:
+                build_snapshot(path, seed_options, verbosity=max(options["verbosity"] - 1, 0))
+            except ValueError as exc:
+                raise CommandError(exc)
+            self.stdout.write(f"Built {path} in {time.perf_counter() - started:.2f}s.")
+
+        if options["action"] == "clone":
+            if not options["target"]:
+                raise CommandError("clone needs a target file, e.g. db_snapshot clone /tmp/library.sqlite3")
+            started = time.perf_counter()
+            clone_snapshot(path, options["target"])
+            self.stdout.write(self.style.SUCCESS(
+                f"Cloned {path.name} to {options['target']} in {(time.perf_counter() - started) * 1000:.1f}ms."
+            ))
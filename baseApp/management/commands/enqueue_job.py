@@ -0,0 +1,25 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from baseApp.jobs import TASKS, enqueue
+
+
+class Command(BaseCommand):
+    help = "Adds a background job to the queue, e.g. from cron: enqueue_job mark_overdue"
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", help="Task name.")
+        parser.add_argument("--payload", default="{}", help="Task keyword arguments as JSON.")
+        parser.add_argument("--delay", type=int, default=0, help="Seconds to wait before the job may run.")
+        parser.add_argument("--max-attempts", type=int, default=5)
+
+    def handle(self, *args, **options):
+        if options["name"] not in TASKS:
+            raise CommandError(f"Unknown task {options['name']!r}, choose from: {', '.join(sorted(TASKS))}")
+        try:
+            payload = json.loads(options["payload"])
+        except ValueError as exc:
+            raise CommandError(f"--payload is not valid JSON: {exc}")
+        job = enqueue(options["name"], payload, delay=options["delay"], max_attempts=options["max_attempts"])
+        self.stdout.write(self.style.SUCCESS(f"Queued {job}, runs at {job.run_at:%Y-%m-%d %H:%M:%S}."))
@@ -0,0 +1,104 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Runs in a fresh interpreter under -X importtime, so nothing is imported yet.
+CHILD = r"""
+import json, os, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter()
+from django.conf import settings
+settings.WARM_UP_ON_START = os.environ["IMPORT_REPORT_WARM_UP"] == "1"
+from Libary_management_system.wsgi import application
+ready = time.perf_counter()
+
+def request():
+    environ = {
+        "REQUEST_METHOD": "GET", "PATH_INFO": os.environ["IMPORT_REPORT_PATH"], "QUERY_STRING": "",
+        "SERVER_NAME": "localhost", "SERVER_PORT": "80", "HTTP_HOST": "localhost",
+        "wsgi.url_scheme": "http", "wsgi.input": sys.stdin.buffer, "wsgi.errors": sys.stderr,
+    }
+    before = time.perf_counter()
+    statuses = []
+    b"".join(application(environ, lambda status, headers: statuses.append(status)))
+    return time.perf_counter() - before, statuses[0]
+
+first, status = request()
+second, _ = request()
+print(json.dumps({
+    "setup": setup - started, "application": ready - setup, "first_request": first,
+    "second_request": second, "status": status,
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the cold start of a worker in a fresh interpreter: django.setup(), "
+        "loading the WSGI application (with its warm-up) and the first requests, "
+        "and lists the slowest imports (python -X importtime)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=15, help="Slowest imports to list.")
+        parser.add_argument("--runs", type=int, default=3, help="Processes to start; medians are reported.")
+        parser.add_argument("--path", default="/books/", help="URL of the measured requests.")
+        parser.add_argument("--api-only", action="store_true", help="Start with LIBRARY_API_ONLY=1.")
+        parser.add_argument("--no-warm-up", action="store_true", help="Skip baseApp/startup.py.")
+
+    def handle(self, *args, **options):
+        if options["runs"] < 1:
+            raise CommandError("--runs must be at least 1.")
+        env = {
+            **os.environ,
+            "IMPORT_REPORT_PATH": options["path"],
+            "IMPORT_REPORT_WARM_UP": "0" if options["no_warm_up"] else "1",
+        }
+        if options["api_only"]:
+            env["LIBRARY_API_ONLY"] = "1"
+        else:
+            env.pop("LIBRARY_API_ONLY", None)
+
+        runs, imports = [], None
+        for _ in range(options["runs"]):
+            child = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", CHILD],
+                env=env, capture_output=True, text=True, stdin=subprocess.DEVNULL,
+            )
+            if child.returncode:
+                raise CommandError(child.stderr[-2000:])
+            runs.append(json.loads(child.stdout.strip().splitlines()[-1]))
+            imports = child.stderr
+
+        phases = ("setup", "application", "first_request", "second_request")
+        medians = {phase: statistics.median(run[phase] for run in runs) for phase in phases}
+        self.stdout.write(f"Worker start, median of {len(runs)} ({runs[-1]['status']} for {options['path']}):")
+        for phase in phases:
+            self.stdout.write(f"  {phase.replace('_', ' '):22} {medians[phase] * 1000:8.1f} ms")
+        total = medians["setup"] + medians["application"] + medians["first_request"]
+        self.stdout.write(self.style.SUCCESS(f"  {'time to first response':22} {total * 1000:8.1f} ms"))
+
+        self.stdout.write("\nSlowest top-level imports (cumulative, last run):")
+        for cumulative, module in self.top_level_imports(imports)[:options["top"]]:
+            self.stdout.write(f"  {cumulative / 1000:8.1f} ms  {module}")
+
+    @staticmethod
+    def top_level_imports(report):
+        """
+        (cumulative microseconds, module) of the imports nobody else triggered.
+        """
+        rows = []
+        for line in report.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit() and not name.startswith("  "):
+                rows.append((int(cumulative), name.strip()))
+        return sorted(rows, reverse=True)
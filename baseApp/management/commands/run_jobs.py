@@ -0,0 +1,61 @@
+import multiprocessing
+import os
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from baseApp import jobs
+
+
+class Command(BaseCommand):
+    help = "Runs queued background jobs with a pool of worker threads or processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Jobs run at the same time.")
+        parser.add_argument("--pool", choices=["thread", "process"], default="thread")
+        parser.add_argument("--poll", type=float, default=1.0, help="Seconds between polls of an empty queue.")
+        parser.add_argument("--burst", action="store_true", help="Exit once no job is due.")
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        if workers < 1:
+            raise CommandError("--workers must be at least 1.")
+        name = f"{socket.gethostname()}:{os.getpid()}"
+
+        if options["pool"] == "process":
+            # Not fork: the children are only started at the first submit, when this
+            # process already has a database connection open. A forked child would
+            # inherit it, and closing it there would end this process's session.
+            # The initializer is django.setup itself, unpickling a function of this
+            # module would import the models before the apps are loaded.
+            context = multiprocessing.get_context("spawn")
+            pool = ProcessPoolExecutor(workers, mp_context=context, initializer=django.setup)
+        else:
+            pool = ThreadPoolExecutor(workers, thread_name_prefix="job")
+
+        self.stdout.write(f"Worker {name} started with {workers} {options['pool']}(s).")
+        running = set()
+        finished = 0
+        try:
+            with pool:
+                while True:
+                    jobs.requeue_stale()
+                    claimed = jobs.claim(name, workers - len(running)) if len(running) < workers else []
+                    for job in claimed:
+                        running.add(pool.submit(jobs.run_by_id, job.pk))
+
+                    if not running:
+                        if options["burst"]:
+                            break
+                        time.sleep(options["poll"])
+                        continue
+                    done, running = wait(running, timeout=options["poll"], return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()  # a crash outside the task itself should stop the worker
+                        finished += 1
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping, waiting for running jobs to finish...")
+        self.stdout.write(self.style.SUCCESS(f"Worker {name} finished {finished} job(s)."))
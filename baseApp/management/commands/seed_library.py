@@ -0,0 +1,354 @@
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from baseApp.models import Genre, Book, BorrowRecord
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+GENRE_NAMES = [
+    "Fiction", "Non-Fiction", "Science", "Technology", "History", "Biography",
+    "Fantasy", "Mystery", "Romance", "Thriller", "Poetry", "Philosophy",
+    "Children", "Young Adult", "Travel", "Cooking", "Art", "Religion",
+    "Business", "Health",
+]
+TITLE_ADJECTIVES = [
+    "Silent", "Hidden", "Lost", "Golden", "Broken", "Last", "Secret", "Endless",
+    "Burning", "Forgotten", "Quiet", "Wild", "Little", "Dark", "Bright", "Distant",
+]
+TITLE_NOUNS = [
+    "River", "Garden", "Kingdom", "Empire", "Road", "Sea", "House", "Mountain",
+    "City", "Storm", "Star", "Forest", "Machine", "Letter", "Winter", "Island",
+]
+FIRST_NAMES = [
+    "Anita", "Rahul", "Maria", "John", "Wei", "Fatima", "Liam", "Sofia", "Arjun",
+    "Elena", "Kenji", "Amara", "Noah", "Priya", "Lucas", "Hana",
+]
+LAST_NAMES = [
+    "Sharma", "Smith", "Garcia", "Chen", "Khan", "Müller", "Rossi", "Tanaka",
+    "Okafor", "Silva", "Novak", "Iyer", "Brown", "Kim", "Dubois", "Costa",
+]
+
+LOAN_DAYS = 7  # same loan period as models.default_due_date
+CHUNK = 10000  # borrow records generated at once, fixed so --batch-size does not change the data
+
+
+def zipf_cum_weights(n, exponent):
+    """
+    Cumulative weights of a Zipf distribution over n ranks, for picking
+    ranks with searchsorted in O(log n) each.
+    """
+    return np.cumsum(1.0 / np.arange(1, n + 1) ** exponent)
+
+
+def isbn13(numbers):
+    """
+    Valid ISBN-13s (with check digit) built from running numbers.
+    """
+    numbers = np.asarray(numbers, dtype=np.int64)
+    total = 9 + 7 * 3 + 8  # the 978 prefix
+    for position in range(9):  # digits of the number, most significant first
+        digit = numbers // 10 ** (8 - position) % 10
+        total = total + digit * (1 if position % 2 else 3)
+    checks = (10 - total % 10) % 10
+    return [f"978{number:09d}{check}" for number, check in zip(numbers.tolist(), checks.tolist())]
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a deterministic synthetic library (genres, books, members and "
+        "borrow records) using bulk inserts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--genres", type=int, default=20)
+        parser.add_argument("--books", type=int, default=10000)
+        parser.add_argument("--members", type=int, default=2000)
+        parser.add_argument("--records", type=int, default=50000)
+        parser.add_argument("--days", type=int, default=730, help="How far back borrow dates go.")
+        parser.add_argument("--seed", type=int, default=42, help="Random seed, same seed gives same data.")
+        parser.add_argument("--batch-size", type=int, default=10000)
+        parser.add_argument(
+            "--password",
+            default="password123",
+            help="Password for every generated member (hashed only once).",
+        )
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError("Generating a library needs numpy.")
+        for name in ("books", "members", "records"):
+            if options[name] < 0:
+                raise CommandError(f"--{name} cannot be negative.")
+        for name in ("genres", "days", "batch_size"):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least 1.")
+        if options["records"] and not (options["books"] and options["members"]):
+            raise CommandError("Borrow records need at least one book and one member.")
+
+        self.batch_size = options["batch_size"]
+        self.seed = options["seed"]
+        self.today = timezone.now().date()
+
+        bulk_load = connection.vendor == "sqlite" and not connection.in_atomic_block
+        if bulk_load:
+            # Fine for a bulk load into a scratch database, roughly doubles insert speed.
+            # Every generated id points at a row of this run or an existing one, so
+            # checking the foreign keys of each row is wasted work.
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA synchronous = OFF")
+                cursor.execute("PRAGMA journal_mode = MEMORY")
+                cursor.execute("PRAGMA cache_size = -200000")
+                cursor.execute("PRAGMA foreign_keys = OFF")
+
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                genre_ids = self.create_genres(options["genres"])
+                member_ids = self.create_members(options["members"], options["password"])
+                book_ids, total_copies = self.plan_books(options["books"])
+                active = self.create_records(options["records"], options["days"], book_ids, total_copies, member_ids)
+                self.create_books(book_ids, total_copies, active, genre_ids)
+        finally:
+            if bulk_load:
+                with connection.cursor() as cursor:
+                    cursor.execute("PRAGMA foreign_keys = ON")
+        elapsed = time.perf_counter() - started
+
+        rows = len(genre_ids) + 2 * len(member_ids) + len(book_ids) + options["records"]
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(genre_ids)} genres, {len(book_ids)} books, {len(member_ids)} members "
+            f"and {options['records']} borrow records in {elapsed:.2f}s "
+            f"({rows / elapsed if elapsed else rows:,.0f} rows/s)."
+        ))
+
+    # ---------------- Helpers ---------------- #
+
+    def rng(self, name):
+        """
+        Separate random stream per table so changing one count
+        does not reshuffle the data of the other tables.
+        """
+        return np.random.default_rng([self.seed, zlib.crc32(name.encode())])
+
+    def next_id(self, model):
+        return (model.objects.aggregate(last=Max("pk"))["last"] or 0) + 1
+
+    def insert(self, model, field_names, rows):
+        """
+        Inserts rows with executemany in batches, skipping model instances entirely.
+        """
+        columns = [model._meta.get_field(name).column for name in field_names]
+        sql = "INSERT INTO {} ({}) VALUES ({})".format(
+            connection.ops.quote_name(model._meta.db_table),
+            ", ".join(connection.ops.quote_name(column) for column in columns),
+            ", ".join(["%s"] * len(columns)),
+        )
+        rows = iter(rows)
+        with connection.cursor() as cursor:
+            while batch := list(islice(rows, self.batch_size)):
+                cursor.executemany(sql, batch)
+
+    @contextmanager
+    def deferred_indexes(self, model):
+        """
+        On SQLite, drops the secondary indexes of an empty table during the load
+        and recreates them afterwards. Building an index once over sorted data is
+        much cheaper than updating it for every random-order insert.
+        """
+        table = model._meta.db_table
+        if connection.vendor != "sqlite" or model.objects.exists():
+            yield
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name, sql FROM sqlite_master "
+                "WHERE type = 'index' AND tbl_name = %s AND sql IS NOT NULL",
+                [table],
+            )
+            indexes = cursor.fetchall()
+            for name, _ in indexes:
+                cursor.execute(f"DROP INDEX {connection.ops.quote_name(name)}")
+            yield
+            for _, sql in indexes:
+                cursor.execute(sql)
+
+    # ---------------- Tables ---------------- #
+
+    def create_genres(self, count):
+        existing = set(Genre.objects.values_list("name", flat=True))
+        names = []
+        round_no = 1
+        while len(names) < count:
+            for base in GENRE_NAMES:
+                name = base if round_no == 1 else f"{base} {round_no}"
+                if name not in existing:
+                    names.append(name)
+                if len(names) == count:
+                    break
+            round_no += 1
+
+        first_id = self.next_id(Genre)
+        ids = list(range(first_id, first_id + count))
+        self.insert(Genre, ["id", "name", "description"], (
+            (genre_id, name, f"Books about {name.lower()}.") for genre_id, name in zip(ids, names)
+        ))
+        return ids
+
+    def create_members(self, count, password):
+        if not count:
+            return []
+        rng = self.rng("members")
+        hashed = make_password(password)  # hashing once, not once per member
+        joined = connection.ops.adapt_datetimefield_value(timezone.now())
+        first_id = self.next_id(User)
+        ids = list(range(first_id, first_id + count))
+        firsts = rng.integers(len(FIRST_NAMES), size=count).tolist()
+        lasts = rng.integers(len(LAST_NAMES), size=count).tolist()
+
+        def rows():
+            for user_id, first, last in zip(ids, firsts, lasts):
+                username = f"member{user_id:07d}"
+                yield (
+                    user_id, hashed, False, username, FIRST_NAMES[first], LAST_NAMES[last],
+                    f"{username}@example.com", False, True, joined,
+                )
+
+        self.insert(User, [
+            "id", "password", "is_superuser", "username", "first_name", "last_name",
+            "email", "is_staff", "is_active", "date_joined",
+        ], rows())
+
+        member_group, _ = Group.objects.get_or_create(name="member")
+        through = User.groups.through
+        self.insert(through, ["user", "group"], ((user_id, member_group.pk) for user_id in ids))
+        return ids
+
+    def plan_books(self, count):
+        """
+        Decides book ids and copy counts up front; the rows themselves are
+        written after the borrow records so available_copies can be exact.
+        Books are generated in popularity order, so low ids are the bestsellers.
+        """
+        rng = self.rng("copies")
+        first_id = self.next_id(Book)
+        ids = np.arange(first_id, first_id + count)
+        ranks = np.arange(1, count + 1)
+        total_copies = np.maximum(
+            1, np.round(12 / ranks ** 0.35).astype(np.int64) + rng.integers(-1, 2, size=count)
+        )
+        return ids, total_copies
+
+    def create_records(self, count, days, book_ids, total_copies, member_ids):
+        """
+        Inserts borrow records and returns the number of active loans per book.
+        A loan only stays active while its book still has a free copy,
+        so available_copies never goes negative.
+
+        Rows are generated a chunk at a time with NumPy. Within a chunk the
+        loans that want to stay out are ranked per book in insert order, and
+        only the first ones that still fit are kept active, the same loans
+        a row-by-row pass would keep.
+        """
+        active = np.zeros(len(book_ids), dtype=np.int64)
+        if not count:
+            return active
+
+        rng = self.rng("records")
+        book_weights = zipf_cum_weights(len(book_ids), 1.1)
+        member_weights = zipf_cum_weights(len(member_ids), 0.6)
+        # Members are shuffled so the heavy readers are not simply the first ids.
+        members = rng.permutation(np.asarray(member_ids))
+
+        adapt = connection.ops.adapt_datefield_value
+        # dates[LOAN_DAYS + n] is n days ago, due dates reach LOAN_DAYS into the future
+        dates = np.array(
+            [adapt(self.today - timedelta(days=offset)) for offset in range(-LOAN_DAYS, days + 1)],
+            dtype=object,
+        )
+        statuses = np.array(["RETURNED", "BORROWED", "OVERDUE"], dtype=object)
+        first_id = self.next_id(BorrowRecord)
+
+        def chunk(start, size):
+            books = np.searchsorted(book_weights, rng.random(size) * book_weights[-1])
+            borrowed = rng.integers(days + 1, size=size)  # days ago
+            due = borrowed - LOAN_DAYS  # negative means due in the future
+            # a few loans are never returned on time, most recent ones are still out
+            wants_out = rng.random(size) < np.where(due >= 0, 0.03, 0.6)
+            returned_after = rng.integers(LOAN_DAYS + 6, size=size)
+
+            candidates = np.flatnonzero(wants_out)
+            order = candidates[np.argsort(books[candidates], kind="stable")]
+            sorted_books = books[order]
+            starts = np.flatnonzero(np.r_[True, sorted_books[1:] != sorted_books[:-1]])
+            rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+            kept = order[active[sorted_books] + rank < total_copies[sorted_books]]
+            active[:] += np.bincount(books[kept], minlength=len(active))
+
+            status = np.zeros(size, dtype=np.int64)
+            status[kept] = np.where(due[kept] > 0, 2, 1)
+            returned = dates[LOAN_DAYS + np.maximum(0, borrowed - returned_after)]
+            returned[kept] = None
+            return zip(
+                range(start, start + size),
+                book_ids[books].tolist(),
+                members[np.searchsorted(member_weights, rng.random(size) * member_weights[-1])].tolist(),
+                dates[LOAN_DAYS + borrowed].tolist(),
+                dates[LOAN_DAYS + due].tolist(),
+                returned.tolist(),
+                statuses[status].tolist(),
+            )
+
+        def rows():
+            for start in range(0, count, CHUNK):
+                yield from chunk(first_id + start, min(CHUNK, count - start))
+
+        with self.deferred_indexes(BorrowRecord):
+            self.insert(BorrowRecord, [
+                "id", "book", "member", "borrow_date", "due_date", "return_date", "status",
+            ], rows())
+        return active
+
+    def create_books(self, book_ids, total_copies, active, genre_ids):
+        rng = self.rng("books")
+        count = len(book_ids)
+        created = connection.ops.adapt_datetimefield_value(timezone.now())
+
+        def pick(items):
+            return np.asarray(items, dtype=object)[rng.integers(len(items), size=count)].tolist()
+
+        short = (rng.random(count) < 0.5).tolist()
+        adjectives, nouns, other_nouns = pick(TITLE_ADJECTIVES), pick(TITLE_NOUNS), pick(TITLE_NOUNS)
+        authors = [f"{first} {last}" for first, last in zip(pick(FIRST_NAMES), pick(LAST_NAMES))]
+        titles = [
+            f"The {adjective} {noun}" if is_short else f"{noun} of the {adjective} {other}"
+            for is_short, adjective, noun, other in zip(short, adjectives, nouns, other_nouns)
+        ]
+        with self.deferred_indexes(Book):
+            self.insert(Book, [
+                "id", "title", "author", "genre", "isbn", "total_copies",
+                "available_copies", "created_at", "updated_at",
+            ], zip(
+                book_ids.tolist(),
+                [f"{title} {book_id}" for title, book_id in zip(titles, book_ids.tolist())],
+                authors,
+                pick(genre_ids),
+                isbn13(book_ids),
+                total_copies.tolist(),
+                (total_copies - active).tolist(),
+                [created] * count,
+                [created] * count,
+            ))
@@ -0,0 +1,85 @@
+"""
+Response compression negotiated from Accept-Encoding: brotli when the
+`brotli` package is installed and the client accepts it, gzip otherwise.
+Over HTTPS only gzip is used, with GZipMiddleware's BREACH mitigation.
+Bodies under settings.RESPONSE_COMPRESSION_MIN_SIZE are sent as they are,
+compressing them costs more than the bytes saved.
+"""
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+
+BROTLI_QUALITY = 5  # 11 (the default) is meant for static files, far too slow per request
+MAX_RANDOM_BYTES = 100  # same as django.middleware.gzip.GZipMiddleware
+
+
+def accepted_encodings(header):
+    """
+    {encoding: quality} of an Accept-Encoding header, zeros included:
+    "gzip;q=0" refuses gzip even when "*" accepts everything else.
+    """
+    accepted = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip():
+            accepted[name.strip().lower()] = quality
+    return accepted
+
+
+def choose_encoding(header, secure=False):
+    """
+    The accepted encoding with the highest quality, brotli on a tie.
+    HTTPS responses are never brotli: only gzip can carry the random
+    padding that Django uses against BREACH.
+    """
+    accepted = accepted_encodings(header)
+    candidates = ["br", "gzip"] if brotli is not None and not secure else ["gzip"]
+    best, best_quality = None, 0.0
+    for encoding in candidates:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        if response.streaming or response.has_header("Content-Encoding"):
+            return response
+        if len(response.content) < settings.RESPONSE_COMPRESSION_MIN_SIZE:
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = choose_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""), request.is_secure())
+        if encoding is None:
+            return response
+
+        if encoding == "br":
+            compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        else:
+            # random bytes in the gzip header vary the length (BREACH), as in GZipMiddleware
+            compressed = compress_string(response.content, max_random_bytes=MAX_RANDOM_BYTES)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        response["Content-Encoding"] = encoding
+        # the representation changed, a strong ETag would no longer match it
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        return response
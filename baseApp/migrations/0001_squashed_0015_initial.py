@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:15
+
+import baseApp.models
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    replaces = [('baseApp', '0001_initial'), ('baseApp', '0002_alter_borrowrecord_member'), ('baseApp', '0003_alter_borrowrecord_borrow_date_and_more'), ('baseApp', '0004_alter_borrowrecord_borrow_date'), ('baseApp', '0005_alter_borrowrecord_due_date'), ('baseApp', '0006_alter_borrowrecord_borrow_date'), ('baseApp', '0007_alter_borrowrecord_borrow_date_and_more'), ('baseApp', '0008_alter_borrowrecord_borrow_date'), ('baseApp', '0009_alter_borrowrecord_borrow_date'), ('baseApp', '0010_alter_borrowrecord_due_date'), ('baseApp', '0011_alter_borrowrecord_borrow_date'), ('baseApp', '0012_alter_borrowrecord_due_date'), ('baseApp', '0013_alter_borrowrecord_member'), ('baseApp', '0014_alter_borrowrecord_member'), ('baseApp', '0015_alter_borrowrecord_member')]
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Genre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Name of the genre', max_length=100, unique=True)),
+                ('description', models.TextField(blank=True, help_text='Description of the genre', null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Book',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(help_text='Title of the book', max_length=200)),
+                ('author', models.CharField(help_text='Author of the book', max_length=100)),
+                ('isbn', models.CharField(help_text='ISBN number of the book', max_length=20, unique=True)),
+                ('total_copies', models.PositiveIntegerField(help_text='Total number of copies available in the library')),
+                ('available_copies', models.PositiveIntegerField(help_text='Number of copies currently available for borrowing')),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='Time when the book was added')),
+                ('updated_at', models.DateTimeField(auto_now=True, help_text='Time when the book record was last updated')),
+                ('genre', models.ForeignKey(help_text='Genre of the book', null=True, on_delete=django.db.models.deletion.CASCADE, to='baseApp.genre')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BorrowRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('borrow_date', models.DateField(default=baseApp.models.get_today, help_text='Date when the book was borrowed.')),
+                ('due_date', models.DateField(default=baseApp.models.default_due_date, help_text='Date when the book should be returned.')),
+                ('return_date', models.DateField(blank=True, help_text='Date when the book was actually returned.', null=True)),
+                ('status', models.CharField(choices=[('BORROWED', 'Borrowed'), ('RETURNED', 'Returned'), ('OVERDUE', 'Overdue')], default='BORROWED', help_text='Current status of the borrowing record.', max_length=10)),
+                ('book', models.ForeignKey(help_text='The book being borrowed.', on_delete=django.db.models.deletion.CASCADE, to='baseApp.book')),
+                ('member', models.ForeignKey(help_text='The member who borrowed the book.', on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
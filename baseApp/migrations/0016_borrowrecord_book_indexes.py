@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('baseApp', '0001_squashed_0015_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='borrowrecord',
+            name='book',
+            field=models.ForeignKey(db_index=False, help_text='The book being borrowed.', on_delete=django.db.models.deletion.CASCADE, to='baseApp.book'),
+        ),
+        migrations.AlterField(
+            model_name='borrowrecord',
+            name='member',
+            field=models.ForeignKey(db_index=False, help_text='The member who borrowed the book.', on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['title'], name='book_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author'], name='book_author_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrecord',
+            index=models.Index(fields=['member', 'status'], name='borrow_member_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrecord',
+            index=models.Index(fields=['book', 'status'], name='borrow_book_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrecord',
+            index=models.Index(fields=['status', 'due_date'], name='borrow_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrecord',
+            index=models.Index(fields=['-borrow_date'], name='borrow_date_desc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrecord',
+            index=models.Index(fields=['due_date'], name='borrow_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrecord',
+            index=models.Index(condition=models.Q(('status__in', ['BORROWED', 'OVERDUE'])), fields=['due_date'], name='borrow_active_due_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:17
+
+import baseApp.models
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('baseApp', '0016_borrowrecord_book_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(help_text="Ticket number in the book's queue, lower is served first.")),
+                ('status', models.CharField(choices=[('WAITING', 'Waiting'), ('FULFILLED', 'Fulfilled'), ('EXPIRED', 'Expired'), ('CANCELLED', 'Cancelled')], default='WAITING', help_text='Current status of the hold.', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='Time when the hold was placed.')),
+                ('expires_at', models.DateTimeField(default=baseApp.models.default_hold_expiry, help_text='Time after which the hold lapses.')),
+                ('book', models.ForeignKey(db_index=False, help_text='The book being reserved.', on_delete=django.db.models.deletion.CASCADE, to='baseApp.book')),
+                ('borrow_record', models.OneToOneField(blank=True, help_text='The loan created when the hold was fulfilled.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reservation', to='baseApp.borrowrecord')),
+                ('member', models.ForeignKey(db_index=False, help_text='The member waiting for the book.', on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['book', 'status', 'position'], name='hold_queue_idx'), models.Index(fields=['member', 'status'], name='hold_member_status_idx')],
+                'constraints': [models.UniqueConstraint(fields=('book', 'position'), name='hold_book_position_unique')],
+            },
+        ),
+    ]
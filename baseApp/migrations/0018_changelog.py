@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:18
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('baseApp', '0017_reservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(help_text='Model name of the changed object, e.g. book.', max_length=30)),
+                ('object_id', models.BigIntegerField(help_text='Primary key of the changed object.')),
+                ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete')], help_text='What happened to the object.', max_length=10)),
+                ('data', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='Field values after the change, empty for deletes.', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='Time of the change.')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['model', 'object_id', 'id'], name='changelog_object_idx'), models.Index(fields=['created_at'], name='changelog_created_idx')],
+            },
+        ),
+    ]
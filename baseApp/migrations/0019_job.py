@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:19
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('baseApp', '0018_changelog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Registered task name.', max_length=100)),
+                ('payload', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='Keyword arguments of the task.')),
+                ('status', models.CharField(choices=[('QUEUED', 'Queued'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='QUEUED', help_text='Current state of the job.', max_length=10)),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Earliest time the job may run.')),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Number of times the job was started.')),
+                ('max_attempts', models.PositiveIntegerField(default=5, help_text='Attempts before the job is marked FAILED.')),
+                ('locked_by', models.CharField(blank=True, help_text='Worker that claimed the job.', max_length=100)),
+                ('locked_at', models.DateTimeField(blank=True, help_text='Time the job was claimed.', null=True)),
+                ('last_error', models.TextField(blank=True, help_text='Traceback of the last failed attempt.')),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='Time the job was enqueued.')),
+                ('finished_at', models.DateTimeField(blank=True, help_text='Time the job succeeded or gave up.', null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_at'], name='job_due_idx')],
+            },
+        ),
+    ]
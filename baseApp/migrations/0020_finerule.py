@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('baseApp', '0019_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FineRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('daily_rate', models.DecimalField(decimal_places=2, help_text='Fee per late day.', max_digits=6)),
+                ('grace_days', models.PositiveIntegerField(default=0, help_text='Late days that are not charged.')),
+                ('cap', models.DecimalField(blank=True, decimal_places=2, help_text='Maximum fee per loan, empty for no limit.', max_digits=8, null=True)),
+                ('genre', models.OneToOneField(help_text='Genre the rule applies to.', on_delete=django.db.models.deletion.CASCADE, related_name='fine_rule', to='baseApp.genre')),
+            ],
+        ),
+    ]
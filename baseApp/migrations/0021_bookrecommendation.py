@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('baseApp', '0020_finerule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(help_text="Cosine similarity of the two books' borrowers.")),
+                ('rank', models.PositiveSmallIntegerField(help_text='1 for the closest neighbour.')),
+                ('book', models.ForeignKey(db_index=False, help_text='The book the recommendation is for.', on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='baseApp.book')),
+                ('recommended', models.ForeignKey(help_text='The recommended book.', on_delete=django.db.models.deletion.CASCADE, related_name='+', to='baseApp.book')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('book', 'rank'), name='recommendation_book_rank_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('baseApp', '0021_bookrecommendation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBorrowRecord',
+            fields=[
+                ('id', models.BigIntegerField(help_text='Id the record had in BorrowRecord.', primary_key=True, serialize=False)),
+                ('borrow_date', models.DateField(help_text='Date when the book was borrowed.')),
+                ('due_date', models.DateField(help_text='Date when the book should have been returned.')),
+                ('return_date', models.DateField(blank=True, help_text='Date when the book was returned.', null=True)),
+                ('status', models.CharField(choices=[('BORROWED', 'Borrowed'), ('RETURNED', 'Returned'), ('OVERDUE', 'Overdue')], help_text='Always RETURNED.', max_length=10)),
+                ('archived_at', models.DateTimeField(auto_now_add=True, help_text='Time when the record was archived.')),
+                ('book', models.ForeignKey(db_index=False, help_text='The book that was borrowed.', on_delete=django.db.models.deletion.CASCADE, to='baseApp.book')),
+                ('member', models.ForeignKey(db_index=False, help_text='The member who borrowed the book.', on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['member', '-borrow_date'], name='archive_member_date_idx'), models.Index(fields=['book', '-borrow_date'], name='archive_book_date_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:49
+
+from django.db import migrations, models
+
+
+def clamp_available_copies(apps, schema_editor):
+    """
+    Returns used to add a copy without checking the total, so existing
+    databases can hold books with more available than total copies.
+    """
+    Book = apps.get_model('baseApp', 'Book')
+    Book.objects.using(schema_editor.connection.alias).filter(
+        available_copies__gt=models.F('total_copies'),
+    ).update(available_copies=models.F('total_copies'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('baseApp', '0022_archivedborrowrecord'),
+    ]
+
+    operations = [
+        migrations.RunPython(clamp_available_copies, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='book',
+            constraint=models.CheckConstraint(condition=models.Q(('available_copies__lte', models.F('total_copies'))), name='book_available_lte_total'),
+        ),
+    ]
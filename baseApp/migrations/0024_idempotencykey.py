@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:51
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('baseApp', '0023_book_available_lte_total'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(help_text='Owner of the key: a user id, or anonymous.', max_length=50)),
+                ('key', models.CharField(help_text='Idempotency-Key header sent by the client.', max_length=255)),
+                ('fingerprint', models.CharField(help_text='SHA-256 of the method, path and body.', max_length=64)),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, help_text='Status of the stored response, null while it runs.', null=True)),
+                ('response', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='Body of the stored response.', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='Time of the first request.')),
+                ('expires_at', models.DateTimeField(help_text='Time after which the key can be used again.')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['expires_at'], name='idempotency_expires_idx')],
+                'constraints': [models.UniqueConstraint(fields=('scope', 'key'), name='idempotency_scope_key_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:13
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('baseApp', '0024_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='borrowrecord',
+            name='borrow_active_due_idx',
+        ),
+    ]
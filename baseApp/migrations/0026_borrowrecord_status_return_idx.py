@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('baseApp', '0025_remove_borrowrecord_active_due_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borrowrecord',
+            index=models.Index(fields=['status', 'return_date'], name='borrow_status_return_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+def purge(apps, schema_editor):
+    """
+    Stored fingerprints were plain SHA-256 digests of request bodies, which
+    can hold passwords, and stored register responses held password hashes.
+    The new fingerprints (HMAC) would not match them anyway.
+    """
+    IdempotencyKey = apps.get_model('baseApp', 'IdempotencyKey')
+    IdempotencyKey.objects.using(schema_editor.connection.alias).all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('baseApp', '0026_borrowrecord_status_return_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(purge, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='idempotencykey',
+            name='fingerprint',
+            field=models.CharField(help_text='HMAC-SHA256 (keyed with SECRET_KEY) of the method, path and body.', max_length=64),
+        ),
+    ]
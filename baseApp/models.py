@@ -1,13 +1,32 @@
-from django.db import models
+from django.db import IntegrityError, connection, models, router, transaction
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 from datetime import timedelta
 
 
 # Create your models here.
 
+class ChangeLoggedModel(models.Model):
+    """
+    Base class for models published through the change feed (/changes/).
+    Every save writes a ChangeLog entry in the same transaction as the row;
+    deletes (including cascades) are logged by the post_delete receiver in signals.py.
+    """
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        action = ChangeLog.CREATE if self._state.adding else ChangeLog.UPDATE
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+            ChangeLog.record(self, action, using=using)
+
+
 # Model for genre
-class Genre(models.Model):
+class Genre(ChangeLoggedModel):
     """
     Represents a category or type of book.
     This model allows easy filtering/searching by genre.
@@ -20,7 +39,7 @@ class Genre(models.Model):
         return self.name
 
 # Model for book
-class Book(models.Model):
+class Book(ChangeLoggedModel):
     """
     Represents a book in the library's collection.
     Stores essential information about each book and its availability.
@@ -34,9 +53,83 @@ class Book(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, help_text="Time when the book was added")
     updated_at = models.DateTimeField(auto_now=True, help_text="Time when the book record was last updated")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["title"], name="book_title_idx"),
+            models.Index(fields=["author"], name="book_author_idx"),
+        ]
+        constraints = [
+            # enforced by the database, so set-based updates are checked too
+            models.CheckConstraint(
+                condition=models.Q(available_copies__lte=models.F("total_copies")),
+                name="book_available_lte_total",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.title} by {self.author}"
-    
+
+    @classmethod
+    def update_inventory(cls, changes, batch_size=500):
+        """
+        Applies stock-taking changes to many books in one transaction.
+        `changes` maps book id -> {field: (value, is_delta)} for total_copies
+        and available_copies; a delta is added to the current count.
+        Every batch of books is one UPDATE with a CASE per field, and the
+        counts are checked by the database constraints.
+        Returns (updated ids, missing ids, invalid ids). Nothing is applied
+        unless both lists of problems are empty.
+        """
+        ids = list(changes)
+        missing, invalid = [], []
+        now = timezone.now()
+        with transaction.atomic():
+            for start in range(0, len(ids), batch_size):
+                batch = ids[start:start + batch_size]
+                values = {}
+                for name in ("total_copies", "available_copies"):
+                    # CASE id WHEN ... written out: resolving thousands of When()
+                    # expressions takes longer than running the UPDATE
+                    column = connection.ops.quote_name(name)
+                    whens, params = [], []
+                    for book_id in batch:
+                        if name in changes[book_id]:
+                            value, is_delta = changes[book_id][name]
+                            whens.append(f"WHEN %s THEN {column} + %s" if is_delta else "WHEN %s THEN %s")
+                            params += [book_id, value]
+                    if whens:
+                        values[name] = models.expressions.RawSQL(
+                            f"CASE {connection.ops.quote_name('id')} {' '.join(whens)} ELSE {column} END",
+                            params, output_field=models.IntegerField(),
+                        )
+                try:
+                    with transaction.atomic():
+                        updated = cls.objects.filter(pk__in=batch).update(**values, updated_at=now)
+                except IntegrityError:
+                    updated = None
+                    # which books broke a rule: the same expressions, as a query
+                    total = values.get("total_copies", models.F("total_copies"))
+                    available = values.get("available_copies", models.F("available_copies"))
+                    invalid.extend(
+                        cls.objects.filter(pk__in=batch)
+                        .annotate(new_total=total, new_available=available)
+                        .filter(
+                            models.Q(new_total__lt=0)
+                            | models.Q(new_available__lt=0)
+                            | models.Q(new_available__gt=models.F("new_total"))
+                        )
+                        .values_list("pk", flat=True)
+                    )
+                if updated != len(batch):
+                    found = set(cls.objects.filter(pk__in=batch).values_list("pk", flat=True))
+                    missing.extend(book_id for book_id in batch if book_id not in found)
+
+            if missing or invalid:
+                transaction.set_rollback(True)
+                return [], missing, invalid
+            ChangeLog.record_many(cls, ids)
+        return ids, [], []
+
     def is_available(self):
         """
         Checks if at least one copy of the book is available.
@@ -56,8 +149,12 @@ def get_today():
     return timezone.now().date()
 
 
+# Loans that still hold a copy of the book
+ACTIVE_STATUSES = ["BORROWED", "OVERDUE"]
+
+
 # Model for borrowing records
-class BorrowRecord(models.Model):
+class BorrowRecord(ChangeLoggedModel):
     """
     Tracks the borrowing history of books.
     Links each borrowed book to the member who borrowed it.
@@ -68,10 +165,12 @@ class BorrowRecord(models.Model):
         ('OVERDUE', 'Overdue'),
     ]
 
-    book = models.ForeignKey(Book, on_delete=models.CASCADE, help_text="The book being borrowed.")
+    # No single-column FK indexes: the composite indexes in Meta start with these columns.
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, db_index=False, help_text="The book being borrowed.")
     member = models.ForeignKey(
         User, 
         on_delete=models.CASCADE,
+        db_index=False,
         help_text="The member who borrowed the book.",
     )
     
@@ -86,24 +185,457 @@ class BorrowRecord(models.Model):
         help_text="Current status of the borrowing record."
     )
 
+    class Meta:
+        indexes = [
+            # a member's loans, optionally by status (member__username filter, "my books")
+            models.Index(fields=["member", "status"], name="borrow_member_status_idx"),
+            # copies of a book that are still out
+            models.Index(fields=["book", "status"], name="borrow_book_status_idx"),
+            # overdue list and status filters, ordered by due date
+            models.Index(fields=["status", "due_date"], name="borrow_status_due_idx"),
+            # default ordering of the borrow record list
+            models.Index(fields=["-borrow_date"], name="borrow_date_desc_idx"),
+            # due_date filter and ordering over all statuses
+            models.Index(fields=["due_date"], name="borrow_due_idx"),
+            # returned loans old enough to be archived (ArchivedBorrowRecord.archive)
+            models.Index(fields=["status", "return_date"], name="borrow_status_return_idx"),
+        ]
+
     def __str__(self):
         return f"{self.member} borrowed {self.book}"
 
     def mark_as_returned(self):
         """
-        Marks the borrow record as returned and updates the book's available copies.
+        Marks the borrow record as returned and frees its copy of the book.
+        If members are waiting for the book, the copy goes straight to the
+        oldest hold (a new loan for that member) instead of back on the shelf.
         """
-        if self.status == 'BORROWED':
+        with transaction.atomic():
+            # The loan is locked and read again: of two concurrent returns,
+            # the second one finds it RETURNED and changes nothing.
+            record = BorrowRecord.objects.select_for_update().get(pk=self.pk)
+            if record.status not in ACTIVE_STATUSES:
+                self.status, self.return_date = record.status, record.return_date
+                return
+            # Row lock, so two returns of the same title cannot hand out the same copy
+            book = Book.objects.select_for_update().get(pk=self.book_id)
             self.status = 'RETURNED'
             self.return_date = timezone.now().date()
-            self.book.available_copies += 1
-            self.book.save()
             self.save()
 
+            self.free_copy(book)
+            self.book = book
+
+    @staticmethod
+    def free_copy(book):
+        """
+        Gives a copy that came back (or whose loan was moved or deleted) to
+        the oldest hold of the book, or puts it back on the shelf. The book
+        must be locked by the caller's transaction.
+        """
+        hold = Reservation.objects.next_in_line(book)
+        if hold is not None:
+            hold.fulfil()
+        else:
+            # Capped: loans from before the available <= total constraint
+            # can come back to a book whose count was already inflated.
+            book.available_copies = min(book.available_copies + 1, book.total_copies)
+            book.save()
+
     def mark_as_overdue(self):
         """
         Marks the borrow record as overdue if past the due date.
         """
         if self.status == 'BORROWED' and timezone.now().date() > self.due_date:
             self.status = 'OVERDUE'
-            self.save()
\ No newline at end of file
+            self.save()
+
+def default_hold_expiry():
+    """
+    Returns the default expiry of a hold, 30 days from now.
+    """
+    return timezone.now() + timedelta(days=30)
+
+
+class ReservationQuerySet(models.QuerySet):
+    def waiting(self):
+        """
+        Holds that are still in the queue (not expired yet).
+        """
+        return self.filter(status='WAITING', expires_at__gt=timezone.now())
+
+    def expire(self):
+        """
+        Marks every waiting hold past its expiry date as EXPIRED in one UPDATE.
+        """
+        return self.filter(status='WAITING', expires_at__lte=timezone.now()).update(status='EXPIRED')
+
+    def next_in_line(self, book):
+        """
+        Returns the oldest waiting hold of a book, locked for update, or None.
+        This is a single seek on the (book, status, position) index, however long the queue is.
+        """
+        self.filter(book=book).expire()
+        return (
+            self.filter(book=book).waiting()
+            .select_for_update()
+            .order_by('position')
+            .first()
+        )
+
+
+# Model for holds (reservations)
+class Reservation(models.Model):
+    """
+    A member's place in the FIFO queue for a book with no available copies.
+    When a copy is returned it is lent to the first waiting member right away.
+    """
+    STATUS_CHOICES = [
+        ('WAITING', 'Waiting'),
+        ('FULFILLED', 'Fulfilled'),
+        ('EXPIRED', 'Expired'),
+        ('CANCELLED', 'Cancelled'),
+    ]
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, db_index=False, help_text="The book being reserved.")
+    member = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False, help_text="The member waiting for the book.")
+    position = models.PositiveIntegerField(help_text="Ticket number in the book's queue, lower is served first.")
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default='WAITING',
+        help_text="Current status of the hold."
+    )
+    created_at = models.DateTimeField(auto_now_add=True, help_text="Time when the hold was placed.")
+    expires_at = models.DateTimeField(default=default_hold_expiry, help_text="Time after which the hold lapses.")
+    borrow_record = models.OneToOneField(
+        BorrowRecord,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="reservation",
+        help_text="The loan created when the hold was fulfilled.",
+    )
+
+    objects = ReservationQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["book", "position"], name="hold_book_position_unique"),
+        ]
+        indexes = [
+            # head of a book's queue and queue position counts
+            models.Index(fields=["book", "status", "position"], name="hold_queue_idx"),
+            # a member's holds
+            models.Index(fields=["member", "status"], name="hold_member_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.member} waiting for {self.book}"
+
+    @classmethod
+    def place(cls, book, member):
+        """
+        Appends a hold to the end of the book's queue.
+        The book row is locked while the next ticket number is taken.
+        """
+        with transaction.atomic():
+            book = Book.objects.select_for_update().get(pk=book.pk)
+            last = (
+                cls.objects.filter(book=book)
+                .order_by('-position')
+                .values_list('position', flat=True)
+                .first()
+            )
+            return cls.objects.create(book=book, member=member, position=(last or 0) + 1)
+
+    def queue_position(self):
+        """
+        1 for the next member to be served, None once the hold left the queue.
+        Counts only the waiting holds ahead of this one on the queue index.
+        """
+        if self.status != 'WAITING' or self.expires_at <= timezone.now():
+            return None
+        return Reservation.objects.filter(book_id=self.book_id, position__lt=self.position).waiting().count() + 1
+
+    def fulfil(self):
+        """
+        Lends the returned copy to this hold's member. Must run inside the
+        transaction that freed the copy (see BorrowRecord.free_copy).
+        """
+        self.borrow_record = BorrowRecord.objects.create(book_id=self.book_id, member_id=self.member_id)
+        self.status = 'FULFILLED'
+        self.save()
+
+
+# Model for the change feed
+class ChangeLog(models.Model):
+    """
+    Append-only log of writes to genres, books and borrow records.
+    The id doubles as the feed cursor: clients ask for everything after
+    the last id they have seen and apply the entries in order. Ids are not
+    in commit order, so the feed holds the cursor back for recent entries
+    (see ChangeFeedViewSet).
+    """
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    ACTION_CHOICES = [
+        (CREATE, 'Create'),
+        (UPDATE, 'Update'),
+        (DELETE, 'Delete'),
+    ]
+
+    model = models.CharField(max_length=30, help_text="Model name of the changed object, e.g. book.")
+    object_id = models.BigIntegerField(help_text="Primary key of the changed object.")
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, help_text="What happened to the object.")
+    data = models.JSONField(
+        null=True,
+        blank=True,
+        encoder=DjangoJSONEncoder,
+        help_text="Field values after the change, empty for deletes.",
+    )
+    created_at = models.DateTimeField(auto_now_add=True, help_text="Time of the change.")
+
+    class Meta:
+        indexes = [
+            # compaction looks for newer entries of the same object
+            models.Index(fields=["model", "object_id", "id"], name="changelog_object_idx"),
+            models.Index(fields=["created_at"], name="changelog_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.action} {self.model} {self.object_id}"
+
+    @classmethod
+    def record(cls, instance, action, using=None):
+        """
+        Writes one entry with a snapshot of the instance's columns.
+        """
+        data = None
+        if action != cls.DELETE:
+            data = {field.attname: field.value_from_object(instance) for field in instance._meta.concrete_fields}
+        return cls.objects.using(using).create(
+            model=instance._meta.model_name,
+            object_id=instance.pk,
+            action=action,
+            data=data,
+        )
+
+    @classmethod
+    def record_many(cls, model, ids, action=UPDATE, using=None):
+        """
+        Logs rows changed by a set-based UPDATE (which bypasses save()).
+        Reads the new values with one query and writes the entries with one bulk insert.
+        """
+        attnames = [field.attname for field in model._meta.concrete_fields]
+        rows = model._default_manager.using(using).filter(pk__in=ids).values(*attnames)
+        return cls.objects.using(using).bulk_create([
+            cls(model=model._meta.model_name, object_id=row[model._meta.pk.attname], action=action, data=row)
+            for row in rows
+        ])
+
+    @classmethod
+    def compact(cls, before):
+        """
+        Deletes entries created before the given time that a newer entry
+        of the same object supersedes. The newest entry of every object is
+        kept (deletes too), so replaying the feed from any cursor, or from
+        the start, still ends in the current state.
+        Returns the number of deleted entries.
+        """
+        newer = cls.objects.filter(
+            model=models.OuterRef("model"),
+            object_id=models.OuterRef("object_id"),
+            id__gt=models.OuterRef("id"),
+        )
+        deleted, _ = cls.objects.filter(created_at__lt=before).filter(models.Exists(newer)).delete()
+        return deleted
+
+
+# Model for background jobs
+class Job(models.Model):
+    """
+    A unit of background work stored in the database (see baseApp/jobs.py).
+    Workers (manage.py run_jobs) claim QUEUED jobs whose run_at has passed,
+    and failed jobs are retried with exponential backoff up to max_attempts.
+    """
+    QUEUED = 'QUEUED'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100, help_text="Registered task name.")
+    payload = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder, help_text="Keyword arguments of the task.")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED, help_text="Current state of the job.")
+    run_at = models.DateTimeField(default=timezone.now, help_text="Earliest time the job may run.")
+    attempts = models.PositiveIntegerField(default=0, help_text="Number of times the job was started.")
+    max_attempts = models.PositiveIntegerField(default=5, help_text="Attempts before the job is marked FAILED.")
+    locked_by = models.CharField(max_length=100, blank=True, help_text="Worker that claimed the job.")
+    locked_at = models.DateTimeField(null=True, blank=True, help_text="Time the job was claimed.")
+    last_error = models.TextField(blank=True, help_text="Traceback of the last failed attempt.")
+    created_at = models.DateTimeField(auto_now_add=True, help_text="Time the job was enqueued.")
+    finished_at = models.DateTimeField(null=True, blank=True, help_text="Time the job succeeded or gave up.")
+
+    class Meta:
+        indexes = [
+            # workers look for due QUEUED jobs, and stale RUNNING ones
+            models.Index(fields=["status", "run_at"], name="job_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+# Model for late fee rules
+class FineRule(models.Model):
+    """
+    Late fee rule for the books of one genre. Books whose genre has no rule
+    use settings.FINE_DEFAULT_RULE. Fines are computed by baseApp/fines.py.
+    """
+    genre = models.OneToOneField(Genre, on_delete=models.CASCADE, related_name="fine_rule", help_text="Genre the rule applies to.")
+    daily_rate = models.DecimalField(max_digits=6, decimal_places=2, help_text="Fee per late day.")
+    grace_days = models.PositiveIntegerField(default=0, help_text="Late days that are not charged.")
+    cap = models.DecimalField(
+        max_digits=8,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        help_text="Maximum fee per loan, empty for no limit.",
+    )
+
+    def __str__(self):
+        return f"{self.genre}: {self.daily_rate}/day"
+
+
+# Model for "patrons also borrowed" recommendations
+class BookRecommendation(models.Model):
+    """
+    One of a book's top neighbours in the co-borrow matrix, precomputed by
+    `manage.py build_recommendations` (see baseApp/recommendations.py).
+    """
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, db_index=False, related_name="recommendations", help_text="The book the recommendation is for.")
+    recommended = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="+", help_text="The recommended book.")
+    score = models.FloatField(help_text="Cosine similarity of the two books' borrowers.")
+    rank = models.PositiveSmallIntegerField(help_text="1 for the closest neighbour.")
+
+    class Meta:
+        constraints = [
+            # also the index a book's recommendations are read with, in order
+            models.UniqueConstraint(fields=["book", "rank"], name="recommendation_book_rank_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.recommended_id} ({self.score:.3f})"
+
+
+# Model for archived loans
+class ArchivedBorrowRecord(models.Model):
+    """
+    A RETURNED borrow record moved out of the hot BorrowRecord table by
+    `manage.py archive_loans`. It keeps its original id, so history lists
+    can show both tables together (/borrow-records/history/).
+    """
+    FIELDS = ["id", "book_id", "member_id", "borrow_date", "due_date", "return_date", "status"]
+
+    id = models.BigIntegerField(primary_key=True, help_text="Id the record had in BorrowRecord.")
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, db_index=False, help_text="The book that was borrowed.")
+    member = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False, help_text="The member who borrowed the book.")
+    borrow_date = models.DateField(help_text="Date when the book was borrowed.")
+    due_date = models.DateField(help_text="Date when the book should have been returned.")
+    return_date = models.DateField(null=True, blank=True, help_text="Date when the book was returned.")
+    status = models.CharField(max_length=10, choices=BorrowRecord.STATUS_CHOICES, help_text="Always RETURNED.")
+    archived_at = models.DateTimeField(auto_now_add=True, help_text="Time when the record was archived.")
+
+    class Meta:
+        indexes = [
+            # a member's or a book's history, newest first
+            models.Index(fields=["member", "-borrow_date"], name="archive_member_date_idx"),
+            models.Index(fields=["book", "-borrow_date"], name="archive_book_date_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.member_id} borrowed {self.book_id} (archived)"
+
+    @classmethod
+    def archive(cls, before, batch_size=1000):
+        """
+        Moves RETURNED records returned before the given date into the archive.
+        Each batch of batch_size records is picked with a range read on the
+        (status, return_date) index and moved in its own transaction, so a
+        long run never holds locks for long and can be stopped at any point.
+        Rows are copied with INSERT ... SELECT, without model instances, and
+        each moved record is logged as a delete in the change feed.
+        Returns the number of archived records.
+        """
+        old = BorrowRecord.objects.filter(status="RETURNED", return_date__lt=before)
+        archived = 0
+        while True:
+            with transaction.atomic():
+                ids = list(old.values_list("id", flat=True)[:batch_size])
+                if not ids:
+                    return archived
+                moved = BorrowRecord.objects.filter(id__in=ids).order_by("id")
+                now = timezone.now()
+                insert_select(cls, moved.values(
+                    *cls.FIELDS, archived_at=models.Value(now, output_field=models.DateTimeField()),
+                ))
+                insert_select(ChangeLog, moved.values(
+                    model=models.Value(BorrowRecord._meta.model_name, output_field=models.CharField()),
+                    object_id=models.F("id"),
+                    action=models.Value(ChangeLog.DELETE, output_field=models.CharField()),
+                    created_at=models.Value(now, output_field=models.DateTimeField()),
+                ))
+                # the hold that led to the loan just loses its link, as on delete
+                Reservation.objects.filter(borrow_record_id__in=ids).update(borrow_record=None)
+                # no post_delete receivers: they would add a query per row
+                moved._raw_delete(moved.db)
+            archived += len(ids)
+
+
+def insert_select(model, queryset):
+    """
+    INSERT INTO model's table the rows of a values() queryset, whose keys
+    are the target field names, in one statement.
+    """
+    columns = ", ".join(
+        connection.ops.quote_name(model._meta.get_field(name).column)
+        for name in queryset.query.values_select + tuple(queryset.query.annotation_select)
+    )
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({columns}) {sql}", params)
+
+
+# Model for idempotent retries of write requests
+class IdempotencyKey(models.Model):
+    """
+    The first response to a request sent with an Idempotency-Key header
+    (see baseApp/idempotency.py). status_code stays null while that first
+    request runs, so retries know to wait for it instead of running again.
+    """
+    scope = models.CharField(max_length=50, help_text="Owner of the key: a user id, or anonymous.")
+    key = models.CharField(max_length=255, help_text="Idempotency-Key header sent by the client.")
+    fingerprint = models.CharField(max_length=64, help_text="HMAC-SHA256 (keyed with SECRET_KEY) of the method, path and body.")
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Status of the stored response, null while it runs.")
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder, help_text="Body of the stored response.")
+    created_at = models.DateTimeField(auto_now_add=True, help_text="Time of the first request.")
+    expires_at = models.DateTimeField(help_text="Time after which the key can be used again.")
+
+    class Meta:
+        constraints = [
+            # also the index every lookup uses
+            models.UniqueConstraint(fields=["scope", "key"], name="idempotency_scope_key_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["expires_at"], name="idempotency_expires_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}/{self.key}"
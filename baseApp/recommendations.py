@@ -0,0 +1,180 @@
+"""
+"Patrons also borrowed" recommendations.
+
+Loans form a sparse member x book matrix M (1 when the member borrowed the
+book at least once). Its product C = M.T @ M is the book x book co-borrow
+matrix: C[a, b] members borrowed both a and b, C[a, a] borrowed a. The
+score of b for a is the cosine similarity C[a, b] / sqrt(C[a, a] * C[b, b]),
+and the top K per book are stored in BookRecommendation.
+
+M is kept on disk (settings.RECOMMENDATIONS_MATRIX) with the id of the last
+loan it contains. A refresh reads the loans after that id, plus the last
+RECOMMENDATIONS_REREAD_LOANS ids before it again (a loan committed late can
+have a lower id than one already read), adds the (member, book) pairs M does
+not have yet and recomputes the books whose rows of C changed: the books of
+the new pairs and everything co-borrowed with them. All of it is vectorized with NumPy and
+SciPy sparse matrices, which are needed for building (not for serving).
+"""
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import ArchivedBorrowRecord, Book, BookRecommendation, BorrowRecord
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+
+TOP_K = 20
+MIN_COUNT = 2  # co-borrows below this are noise
+CHUNK = 2000  # books per block of C computed at once
+
+
+def matrix_path():
+    return settings.RECOMMENDATIONS_MATRIX
+
+
+def load_matrix(path):
+    with np.load(path) as saved:
+        matrix = sparse.csr_matrix(
+            (saved["data"], saved["indices"], saved["indptr"]), shape=tuple(saved["shape"])
+        )
+        return matrix, int(saved["watermark"])
+
+
+def save_matrix(path, matrix, watermark):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as file:  # np.savez would add .npz to a str path
+        np.savez(
+            file, data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+            shape=np.array(matrix.shape), watermark=np.array(watermark),
+        )
+
+
+def loans_after(watermark):
+    """
+    (member ids, book ids, highest loan id) of the loans after the watermark,
+    archived ones included (they keep their ids). The highest id is the
+    watermark itself when there are none.
+    """
+    columns = ("id", "member_id", "book_id")
+    rows = np.array(
+        BorrowRecord.objects.filter(id__gt=watermark).values_list(*columns).union(
+            ArchivedBorrowRecord.objects.filter(id__gt=watermark).values_list(*columns), all=True
+        ),
+        dtype=np.int64,
+    ).reshape(-1, 3)
+    return rows[:, 1], rows[:, 2], int(rows[:, 0].max(initial=watermark))
+
+
+def incidence(members, books, shape):
+    data = np.ones(len(members), dtype=np.int32)
+    matrix = sparse.csr_matrix((data, (members, books)), shape=shape)
+    matrix.data[:] = 1  # repeated loans of the same book count once
+    return matrix
+
+
+def top_neighbours(matrix, books, top_k=TOP_K, min_count=MIN_COUNT):
+    """
+    Top-k cosine neighbours of the given books, as arrays
+    (book, recommended, score, rank), in blocks of CHUNK rows of C.
+    """
+    by_book = matrix.tocsc()
+    borrowers = np.asarray(by_book.sum(axis=0)).ravel()
+    parts = []
+    for start in range(0, len(books), CHUNK):
+        chunk = books[start:start + CHUNK]
+        block = (by_book[:, chunk].T @ matrix).tocsr()
+        rows = np.repeat(np.arange(len(chunk)), np.diff(block.indptr))
+        owners, others, counts = chunk[rows], block.indices, block.data
+        keep = (others != owners) & (counts >= min_count)
+        owners, others, counts = owners[keep], others[keep], counts[keep]
+        scores = counts / np.sqrt(borrowers[owners] * borrowers[others].astype(np.float64))
+
+        order = np.lexsort((others, -scores, owners))
+        owners, others, scores = owners[order], others[order], scores[order]
+        ranks = np.arange(len(owners)) - np.searchsorted(owners, owners, side="left") + 1
+        keep = ranks <= top_k
+        parts.append((owners[keep], others[keep], scores[keep], ranks[keep]))
+    if not parts:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, empty.astype(np.float64), empty
+    return tuple(np.concatenate(column) for column in zip(*parts))
+
+
+def write(books, neighbours, replace_all=False, batch_size=5000):
+    """
+    Replaces the stored recommendations of the given books (of all books
+    with replace_all) in one transaction.
+    """
+    owners, others, scores, ranks = neighbours
+    # the matrix still has columns for deleted books
+    existing = np.fromiter(Book.objects.values_list("id", flat=True).iterator(), dtype=np.int64)
+    keep = np.isin(owners, existing) & np.isin(others, existing)
+    rows = list(zip(owners[keep].tolist(), others[keep].tolist(), scores[keep].tolist(), ranks[keep].tolist()))
+    # plain executemany: model instances would cost more than the whole computation
+    meta = BookRecommendation._meta
+    sql = "INSERT INTO {} ({}) VALUES (%s, %s, %s, %s)".format(
+        connection.ops.quote_name(meta.db_table),
+        ", ".join(
+            connection.ops.quote_name(meta.get_field(name).column)
+            for name in ("book", "recommended", "score", "rank")
+        ),
+    )
+    with transaction.atomic():
+        if replace_all:
+            BookRecommendation.objects.all().delete()
+        else:
+            books = books.tolist()
+            for start in range(0, len(books), batch_size):
+                BookRecommendation.objects.filter(book_id__in=books[start:start + batch_size]).delete()
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                cursor.executemany(sql, rows[start:start + batch_size])
+    return len(rows)
+
+
+def build(full=False, top_k=TOP_K, min_count=MIN_COUNT):
+    """
+    Brings the recommendations up to date. Returns (loans read, books updated, rows written).
+    """
+    if np is None:
+        raise ImportError("Building recommendations needs numpy and scipy.")
+    path = matrix_path()
+    full = full or not path.exists()
+    if full:
+        members, books, watermark = loans_after(0)
+        shape = (int(members.max(initial=0)) + 1, int(books.max(initial=0)) + 1)
+        matrix = incidence(members, books, shape)
+        affected = np.flatnonzero(np.diff(matrix.tocsc().indptr))
+    else:
+        matrix, watermark = load_matrix(path)
+        reread = max(watermark - settings.RECOMMENDATIONS_REREAD_LOANS, 0)
+        members, books, last = loans_after(reread)
+        if not len(members):
+            return 0, 0, 0
+        watermark = max(watermark, last)
+        shape = (
+            max(matrix.shape[0], int(members.max()) + 1),
+            max(matrix.shape[1], int(books.max()) + 1),
+        )
+        matrix.resize(shape)
+        delta = incidence(members, books, shape)
+        # only pairs M does not have yet change C; the re-read loans are mostly in it
+        delta = delta - delta.multiply(matrix)
+        delta.eliminate_zeros()
+        if not delta.nnz:
+            save_matrix(path, matrix.tocsr(), watermark)
+            return len(members), 0, 0
+        matrix = matrix + delta
+        # changed rows of C: newly paired books, and the books co-borrowed with them
+        # (their cosine depends on the new books' borrower counts)
+        new_books = np.unique(delta.tocoo().col)
+        touched = (matrix.tocsc()[:, new_books].T @ matrix).tocsc()
+        affected = np.union1d(new_books, np.flatnonzero(np.diff(touched.indptr)))
+
+    written = write(affected, top_neighbours(matrix, affected, top_k, min_count), replace_all=full)
+    save_matrix(path, matrix.tocsr(), watermark)
+    return len(members), len(affected), written
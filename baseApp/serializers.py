@@ -1,29 +1,68 @@
 from rest_framework import serializers
-from .models import Genre, Book, BorrowRecord
+from .models import Genre, Book, BorrowRecord, Reservation, ChangeLog, FineRule, BookRecommendation
 from django.contrib.auth.models import User, Group
 from django.contrib.auth.hashers import make_password
 
 
-class GenreSerializer(serializers.ModelSerializer):
+class DynamicFieldsMixin:
+    """
+    Takes an optional `fields` argument and drops every other field.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class GenreSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Genre
         fields = "__all__"
 
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Book
         fields = "__all__"
         read_only_fields = ("created_at", "updated_at")
 
     def validate(self, data):
-        if data["available_copies"] > data["total_copies"]:
+        # a partial update may send only one of the counts, compare with the stored other one
+        available = data.get("available_copies", getattr(self.instance, "available_copies", None))
+        total = data.get("total_copies", getattr(self.instance, "total_copies", None))
+        if available is not None and total is not None and available > total:
             raise serializers.ValidationError(
                 "Available copies cannot exceed total copies."
             )
         return data
 
-class BorrowRecordSerializer(serializers.ModelSerializer):
+
+class BookInventorySerializer(serializers.Serializer):
+    """
+    One line of a stock-taking update: new counts, or deltas to add to them.
+    """
+    id = serializers.IntegerField()
+    total_copies = serializers.IntegerField(min_value=0, required=False)
+    available_copies = serializers.IntegerField(min_value=0, required=False)
+    total_copies_delta = serializers.IntegerField(required=False)
+    available_copies_delta = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        changes = {}
+        for name in ("total_copies", "available_copies"):
+            if name in data and f"{name}_delta" in data:
+                raise serializers.ValidationError(f"Send either {name} or {name}_delta, not both.")
+            if name in data:
+                changes[name] = (data[name], False)
+            elif f"{name}_delta" in data:
+                changes[name] = (data[f"{name}_delta"], True)
+        if not changes:
+            raise serializers.ValidationError("Nothing to change.")
+        return {"id": data["id"], "changes": changes}
+
+class BorrowRecordSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for the BorrowRecord model, representing a record of a book borrowed by a member.
     Fields:
@@ -69,12 +108,83 @@ class BorrowRecordSerializer(serializers.ModelSerializer):
             return value
 
 
+class LoanHistorySerializer(serializers.Serializer):
+    """
+    A loan from either BorrowRecord or the archive (read only).
+    """
+    id = serializers.IntegerField()
+    book = serializers.IntegerField(source="book_id")
+    book_title = serializers.CharField()
+    member = serializers.IntegerField(source="member_id")
+    borrow_date = serializers.DateField(format="%Y-%m-%d")
+    due_date = serializers.DateField(format="%Y-%m-%d")
+    return_date = serializers.DateField(format="%Y-%m-%d", allow_null=True)
+    status = serializers.CharField()
+    archived = serializers.BooleanField()
+
+
+class ReservationSerializer(serializers.ModelSerializer):
+    """
+    Serializer for holds. The member defaults to the logged-in user,
+    and a hold can only be placed on a book with no available copies.
+    """
+    book_title = serializers.CharField(source="book.title", read_only=True)
+    member = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), required=False)
+
+    class Meta:
+        model = Reservation
+        fields = [
+            "id",
+            "book",
+            "book_title",
+            "member",
+            "position",
+            "status",
+            "created_at",
+            "expires_at",
+            "borrow_record",
+        ]
+        read_only_fields = ["position", "status", "created_at", "expires_at", "borrow_record"]
+
+    def validate_book(self, value):
+        if value.available_copies > 0:
+            raise serializers.ValidationError("This book has available copies, borrow it instead.")
+        return value
+
+
+class ChangeLogSerializer(serializers.ModelSerializer):
+    cursor = serializers.IntegerField(source="id", read_only=True)
+
+    class Meta:
+        model = ChangeLog
+        fields = ["cursor", "model", "object_id", "action", "data", "created_at"]
+
+
+class BookRecommendationSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source="recommended.id", read_only=True)
+    title = serializers.CharField(source="recommended.title", read_only=True)
+    author = serializers.CharField(source="recommended.author", read_only=True)
+
+    class Meta:
+        model = BookRecommendation
+        fields = ["id", "title", "author", "score", "rank"]
+
+
+class FineRuleSerializer(serializers.ModelSerializer):
+    genre_name = serializers.CharField(source="genre.name", read_only=True)
+
+    class Meta:
+        model = FineRule
+        fields = ["id", "genre", "genre_name", "daily_rate", "grace_days", "cap"]
+
+
 # Serializer for Authentication
 class UserSerializer(serializers.ModelSerializer):
-    # password = serializers.CharField(write_only=True) # This field will not be returned in the response
     class Meta:
         model = User
         fields = ['username', 'password', 'groups', 'email', 'first_name', 'last_name']
+        # The password hash is never returned (or stored with replayed register responses)
+        extra_kwargs = {'password': {'write_only': True}}
     
     def create(self, validated_data):
         raw_password = validated_data.pop('password') # remove and assigned password key and value which user sent and validated
@@ -99,7 +209,7 @@ class LoginSerializer(serializers.Serializer):
 
 
 # member
-class MemberSerializer(serializers.ModelSerializer):
+class MemberSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
@@ -0,0 +1,83 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from . import availability, fines, logins, typeahead
+from .models import Genre, Book, BorrowRecord, ChangeLog, FineRule
+
+
+@receiver(post_delete, sender=Genre)
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=BorrowRecord)
+def log_delete(sender, instance, using, **kwargs):
+    """
+    Logs deletes for the change feed. Django sends post_delete inside the
+    delete's transaction, for cascaded rows as well.
+    """
+    ChangeLog.record(instance, ChangeLog.DELETE, using=using)
+
+
+@receiver(post_save, sender=FineRule)
+@receiver(post_delete, sender=FineRule)
+def invalidate_fines(sender, using, **kwargs):
+    """
+    Rule changes make today's fines out of date. They are recomputed on the
+    next lookup, after the change is committed. Loans are left out on purpose:
+    a new loan is not late yet, a loan returned today keeps the fee it reached
+    until the next day's computation, and an edited due date shows the next day.
+    """
+    transaction.on_commit(fines.invalidate, using=using)
+
+
+@receiver(post_save, sender=Book)
+def store_availability(sender, instance, using, **kwargs):
+    """
+    Lending and returning save the book, so the availability cache is
+    updated with the new counts as soon as the change is committed.
+    """
+    transaction.on_commit(lambda: availability.store(instance), using=using)
+
+
+@receiver(post_delete, sender=Book)
+def forget_availability(sender, instance, using, **kwargs):
+    transaction.on_commit(lambda: availability.forget(instance), using=using)
+
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, using, **kwargs):
+    transaction.on_commit(lambda: typeahead.book_saved(instance), using=using)
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, using, **kwargs):
+    transaction.on_commit(lambda: typeahead.book_deleted(instance), using=using)
+
+
+@receiver(post_save, sender=Genre)
+def index_genre(sender, instance, using, **kwargs):
+    transaction.on_commit(lambda: typeahead.genre_saved(instance), using=using)
+
+
+@receiver(post_delete, sender=Genre)
+def unindex_genre(sender, instance, using, **kwargs):
+    transaction.on_commit(lambda: typeahead.genre_deleted(instance), using=using)
+
+
+@receiver(post_save, sender=BorrowRecord)
+def count_loan(sender, instance, created, using, **kwargs):
+    """
+    Every new loan makes the book, its author and genre rank higher in the typeahead.
+    """
+    if created:
+        transaction.on_commit(lambda: typeahead.loan_created(instance), using=using)
+
+
+@receiver(post_delete, sender=Token)
+def forget_token(sender, instance, using, **kwargs):
+    """
+    A deleted (revoked) token must not be handed out by the login cache.
+    The cache is shared, so this evicts it for every worker process.
+    """
+    transaction.on_commit(lambda: logins.forget_token(instance.user_id), using=using)
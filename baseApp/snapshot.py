@@ -0,0 +1,105 @@
+"""
+Migrated (and optionally seeded) SQLite database snapshots.
+
+A snapshot is built once by running the migrations into a file, then cloned
+with SQLite's online backup API wherever a fresh database is needed: the test
+runner and throwaway environments. Snapshot files are named after a hash of
+every migration on disk, so changing a migration simply produces a new file.
+"""
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.loader import MigrationLoader
+
+
+def migrations_fingerprint():
+    """
+    Hash of the source of every migration of every installed app.
+    """
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    digest = hashlib.sha256()
+    for key in sorted(loader.disk_migrations):
+        digest.update(repr(key).encode())
+        digest.update(inspect.getsource(inspect.getmodule(loader.disk_migrations[key])).encode())
+    return digest.hexdigest()
+
+
+def snapshot_path(seed_options=None):
+    """
+    Where the snapshot for the current migrations (and seed options) lives.
+    """
+    digest = hashlib.sha256(migrations_fingerprint().encode())
+    if seed_options:
+        digest.update(json.dumps(seed_options, sort_keys=True).encode())
+    return Path(settings.DB_SNAPSHOT_DIR) / f"{digest.hexdigest()[:16]}.sqlite3"
+
+
+def build_snapshot(path, seed_options=None, verbosity=0, using=DEFAULT_DB_ALIAS):
+    """
+    Migrates a new SQLite file (and runs seed_library when seed_options are given),
+    then moves it to path. The file is written under a temporary name first, so
+    concurrent builds never see a half-built snapshot.
+    """
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        raise ValueError("Database snapshots need an SQLite database.")
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    temporary.unlink(missing_ok=True)
+
+    old_name = connection.settings_dict["NAME"]
+    connection.close()
+    connection.settings_dict["NAME"] = str(temporary)
+    try:
+        call_command("migrate", database=using, interactive=False, verbosity=verbosity)
+        if seed_options:
+            call_command("seed_library", verbosity=verbosity, **seed_options)
+    finally:
+        connection.close()
+        connection.settings_dict["NAME"] = old_name
+    os.replace(temporary, path)
+    return path
+
+
+def clone_snapshot(path, target):
+    """
+    Copies the snapshot into target, an open sqlite3 connection or a file path,
+    page by page with the backup API (no SQL is replayed).
+    """
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        if isinstance(target, sqlite3.Connection):
+            source.backup(target)
+        else:
+            destination = sqlite3.connect(target)
+            try:
+                source.backup(destination)
+            finally:
+                destination.close()
+    finally:
+        source.close()
+
+
+def save_snapshot(connection, path):
+    """
+    Stores the database behind an open Django SQLite connection as a snapshot.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    destination = sqlite3.connect(temporary)
+    try:
+        connection.ensure_connection()
+        connection.connection.backup(destination)
+    finally:
+        destination.close()
+    os.replace(temporary, path)
@@ -0,0 +1,55 @@
+"""
+Work a new WSGI/ASGI worker does before its first request instead of during it
+(called from wsgi.py and asgi.py when settings.WARM_UP_ON_START is set).
+
+- The URL resolver imports every view module and compiles the routes.
+- DRF settings import their renderer, parser, authentication, permission,
+  filter and pagination classes on first access.
+- Building the fields of every view's serializer fills the models' _meta
+  caches and imports the serializer field classes.
+
+Nothing here touches the database, so it is safe before a pre-forking server
+(gunicorn --preload) forks its workers, which then share the warmed memory.
+"""
+from django.urls import URLPattern, URLResolver, get_resolver
+from rest_framework.settings import api_settings
+
+
+DRF_SETTINGS = (
+    "DEFAULT_RENDERER_CLASSES",
+    "DEFAULT_PARSER_CLASSES",
+    "DEFAULT_AUTHENTICATION_CLASSES",
+    "DEFAULT_PERMISSION_CLASSES",
+    "DEFAULT_FILTER_BACKENDS",
+    "DEFAULT_PAGINATION_CLASS",
+    "DEFAULT_CONTENT_NEGOTIATION_CLASS",
+    "DEFAULT_METADATA_CLASS",
+    "EXCEPTION_HANDLER",
+)
+
+
+def view_classes(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from view_classes(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and hasattr(pattern.callback, "cls"):
+            yield pattern.callback.cls
+
+
+def warm_up():
+    """
+    Returns the number of serializers whose fields were built.
+    """
+    resolver = get_resolver()
+    resolver.reverse_dict  # populates the reverse lookup tables too
+    for name in DRF_SETTINGS:
+        getattr(api_settings, name)
+
+    serializers = {
+        view.serializer_class
+        for view in view_classes(resolver.url_patterns)
+        if getattr(view, "serializer_class", None) is not None
+    }
+    for serializer_class in serializers:
+        serializer_class().fields
+    return len(serializers)
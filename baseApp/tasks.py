@@ -0,0 +1,116 @@
+"""
+Background tasks run by the job queue (see baseApp/jobs.py).
+"""
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .jobs import enqueue, task
+from .models import ArchivedBorrowRecord, BorrowRecord, ChangeLog, IdempotencyKey, Reservation
+
+
+@task("mark_overdue")
+def mark_overdue(batch_size=1000, send_reminders=True):
+    """
+    Moves every BORROWED record past its due date to OVERDUE with set-based
+    UPDATEs in batches (the same rule as BorrowRecord.mark_as_overdue),
+    logs the changes for the change feed, then queues the reminders.
+    """
+    today = timezone.now().date()
+    ids = list(
+        BorrowRecord.objects.filter(status="BORROWED", due_date__lt=today)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        with transaction.atomic():
+            BorrowRecord.objects.filter(pk__in=batch, status="BORROWED").update(status="OVERDUE")
+            ChangeLog.record_many(BorrowRecord, batch)
+    if ids and send_reminders:
+        enqueue("send_overdue_reminders")
+    return len(ids)
+
+
+@task("send_overdue_reminders")
+def send_overdue_reminders(batch_size=500):
+    """
+    Sends one reminder per member listing all of their overdue books,
+    instead of one email per record. Messages go out in batches over a
+    single mail connection.
+    """
+    records = (
+        BorrowRecord.objects.filter(status="OVERDUE")
+        .exclude(member__email="")
+        .select_related("book", "member")
+        .only("due_date", "book__title", "member__username", "member__first_name", "member__email")
+        .order_by("member_id", "due_date")
+    )
+    sent = 0
+    messages = []
+    with get_connection() as mail:
+        for member, loans in groupby(records.iterator(chunk_size=2000), key=lambda record: record.member):
+            lines = [f"- {loan.book.title} (due {loan.due_date:%Y-%m-%d})" for loan in loans]
+            messages.append(EmailMessage(
+                subject="Overdue library books",
+                body=(
+                    f"Hello {member.first_name or member.username},\n\n"
+                    f"The following books are overdue, please return them:\n" + "\n".join(lines)
+                ),
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[member.email],
+            ))
+            if len(messages) >= batch_size:
+                sent += mail.send_messages(messages) or 0
+                messages = []
+        if messages:
+            sent += mail.send_messages(messages) or 0
+    return sent
+
+
+@task("expire_holds")
+def expire_holds():
+    """
+    Marks lapsed holds as EXPIRED in one UPDATE.
+    """
+    return Reservation.objects.expire()
+
+
+@task("compact_changes")
+def compact_changes(days=30):
+    """
+    Same as manage.py compact_changes.
+    """
+    return ChangeLog.compact(timezone.now() - timedelta(days=days))
+
+
+@task("purge_idempotency_keys")
+def purge_idempotency_keys():
+    """
+    Deletes expired Idempotency-Key entries in one DELETE.
+    """
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+@task("build_recommendations")
+def build_recommendations(full=False):
+    """
+    Same as manage.py build_recommendations, e.g. scheduled nightly.
+    """
+    from . import recommendations  # NumPy and SciPy: only imported by the worker that builds
+
+    return recommendations.build(full=full)
+
+
+@task("archive_loans")
+def archive_loans(days=None, batch_size=1000):
+    """
+    Same as manage.py archive_loans.
+    """
+    days = settings.ARCHIVE_LOANS_AFTER_DAYS if days is None else days
+    return ArchivedBorrowRecord.archive(timezone.now().date() - timedelta(days=days), batch_size)
@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from .snapshot import clone_snapshot, save_snapshot, snapshot_path
+
+
+class SnapshotTestRunner(DiscoverRunner):
+    """
+    Test runner that migrates the SQLite test database only once.
+    The first run saves the migrated database as a snapshot; later runs
+    clone that snapshot into the in-memory test database instead of
+    replaying every migration. Falls back to the normal setup for other
+    backends, --keepdb, --parallel and multi-database projects.
+
+    Tests also get a private in-memory cache instead of the shared one in
+    settings.CACHES, so entries of the dev server or of earlier runs never
+    leak into them.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_settings = override_settings(CACHES={
+            alias: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": alias}
+            for alias in settings.CACHES
+        })
+        self._cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache_settings.disable()
+        super().teardown_test_environment(**kwargs)
+
+    def setup_databases(self, **kwargs):
+        connection = connections[DEFAULT_DB_ALIAS]
+        if (
+            DEFAULT_DB_ALIAS not in kwargs.get("aliases", {DEFAULT_DB_ALIAS})
+            or connection.vendor != "sqlite"
+            or len(settings.DATABASES) > 1
+            or self.keepdb
+            or self.parallel > 1
+            or not connection.creation.is_in_memory_db(
+                connection.creation._get_test_db_name()
+            )
+        ):
+            return super().setup_databases(**kwargs)
+
+        path = snapshot_path()
+        if not path.exists():
+            old_config = super().setup_databases(**kwargs)
+            save_snapshot(connection, path)
+            return old_config
+
+        if self.verbosity >= 1:
+            self.log(f"Cloning test database for alias '{connection.alias}' from {path.name}...")
+        old_name = connection.settings_dict["NAME"]
+        connection.close()
+        test_name = connection.creation._get_test_db_name()
+        settings.DATABASES[connection.alias]["NAME"] = test_name
+        connection.settings_dict["NAME"] = test_name
+        connection.ensure_connection()
+        clone_snapshot(path, connection.connection)
+
+        serialized_aliases = kwargs.get("serialized_aliases")
+        if serialized_aliases is None or connection.alias in serialized_aliases:
+            connection._test_serialized_contents = connection.creation.serialize_db_to_string()
+        return [(connection, old_name, True)]
@@ -1,3 +1,1302 @@
-from django.test import TestCase
+import difflib
+import gzip
+import hashlib
+import importlib.util
+import json
+import re
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User, Group, Permission
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Count, F, Q
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from Libary_management_system import settings as project_settings
+
+from . import availability, fines, idempotency, jobs, logins, middleware, startup, typeahead
+from .models import (
+    Genre,
+    Book,
+    BorrowRecord,
+    ArchivedBorrowRecord,
+    Reservation,
+    ChangeLog,
+    FineRule,
+    BookRecommendation,
+    IdempotencyKey,
+    Job,
+    ACTIVE_STATUSES,
+)
+
+
+# ---------------- Query budgets ---------------- #
+
+# Maximum number of SQL queries per endpoint, keyed by (HTTP method, URL name).
+# Every request is measured twice, with SMALL and LARGE amounts of data, and both
+# runs must issue the same number of queries (no N+1) within the budget.
+QUERY_BUDGETS = {
+    ("GET", "api-root"): 1,
+    ("GET", "admin:index"): 3,
+    ("GET", "genre-list"): 3,
+    ("POST", "genre-list"): 6,
+    ("GET", "genre-detail"): 2,
+    ("PUT", "genre-detail"): 7,
+    ("PATCH", "genre-detail"): 7,
+    ("DELETE", "genre-detail"): 8,
+    ("GET", "book-list"): 3,
+    ("POST", "book-list"): 7,
+    ("GET", "book-detail"): 2,
+    ("PUT", "book-detail"): 8,
+    ("PATCH", "book-detail"): 8,
+    ("DELETE", "book-detail"): 10,
+    ("GET", "book-availability"): 2,
+    ("POST", "book-availability"): 2,
+    ("PATCH", "book-inventory"): 10,
+    ("GET", "book-typeahead"): 4,
+    ("GET", "book-recommendations"): 2,
+    ("GET", "borrowrecord-list"): 3,
+    ("POST", "borrowrecord-list"): 12,
+    ("GET", "borrowrecord-detail"): 2,
+    ("PUT", "borrowrecord-detail"): 18,
+    ("PATCH", "borrowrecord-detail"): 18,
+    ("DELETE", "borrowrecord-detail"): 15,
+    ("POST", "borrowrecord-mark-as-returned"): 14,
+    ("POST", "borrowrecord-mark-as-overdue"): 6,
+    ("GET", "borrowrecord-overdue-list"): 2,
+    ("GET", "borrowrecord-history"): 3,
+    ("GET", "hold-list"): 3,
+    ("POST", "hold-list"): 11,
+    ("GET", "hold-detail"): 2,
+    ("DELETE", "hold-detail"): 5,
+    ("GET", "hold-position"): 3,
+    ("GET", "fine-list"): 3,
+    ("GET", "fine-member"): 3,
+    ("GET", "fine-record"): 3,
+    ("GET", "finerule-list"): 3,
+    ("POST", "finerule-list"): 6,
+    ("GET", "finerule-detail"): 2,
+    ("PUT", "finerule-detail"): 7,
+    ("PATCH", "finerule-detail"): 7,
+    ("DELETE", "finerule-detail"): 5,
+    ("GET", "change-feed"): 2,
+    ("POST", "register"): 6,
+    ("POST", "login"): 6,
+    ("GET", "group-list"): 3,
+    ("GET", "member-list"): 3,
+    ("GET", "member-detail"): 2,
+}
+
+# Routes that take their GET parameters from request_for()
+QUERY_STRING_ROUTES = {"book-availability", "book-typeahead"}
+
+SMALL = 2
+LARGE = 8  # still below the page size, so an N+1 would show up in the count
+
+
+def normalize_sql(sql):
+    """
+    Replaces literals so the same query with different ids or values compares equal.
+    """
+    sql = re.sub(r"'(?:[^']|'')*'", "'?'", sql)
+    return re.sub(r"\b\d+(?:\.\d+)?\b", "N", sql)
+
+
+def format_queries(queries):
+    return "\n".join(f"{number:3}. {sql}" for number, sql in enumerate(queries, start=1))
+
+
+def project_caches(test):
+    """
+    Runs the test with the CACHES of settings.py instead of the test runner's
+    in-memory ones. File caches move to a temporary directory, and keys get a
+    prefix of their own in case LIBRARY_REDIS_URL points at a real Redis.
+    """
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    configured = {}
+    for alias, config in project_settings.CACHES.items():
+        config = {**config, "KEY_PREFIX": f"test-{test.id()}"}
+        if config["BACKEND"].endswith("FileBasedCache"):
+            config["LOCATION"] = Path(directory.name) / alias
+        configured[alias] = config
+    override = override_settings(CACHES=configured)
+    override.enable()
+    test.addCleanup(override.disable)
+    for alias in configured:
+        test.addCleanup(caches[alias].clear)
+
+
+def share_connection_with_logins(test):
+    """
+    /login/ runs authenticate() on a pool thread. A connection of its own
+    would wait on the test's open transaction in the in-memory database, so
+    the thread gets the test's connection, as LiveServerTestCase does for
+    its server thread. Its queries are then counted with the test's.
+    """
+    shared = connections[DEFAULT_DB_ALIAS]
+    check = logins._authenticate
+
+    def on_shared_connection(*args):
+        connections[DEFAULT_DB_ALIAS] = shared
+        try:
+            return check(*args)
+        finally:
+            del connections[DEFAULT_DB_ALIAS]
+
+    shared.inc_thread_sharing()
+    test.addCleanup(shared.dec_thread_sharing)
+    patcher = mock.patch.object(logins, "_authenticate", on_shared_connection)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    TYPEAHEAD_BUILD_IN_BACKGROUND=False,
+)
+class LibraryTestCase(APITestCase):
+    """
+    Base class of the API tests: member and librarian groups, a librarian
+    logged in with a token, and helpers that create unique objects.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Group.objects.create(name="member")
+        librarians = Group.objects.create(name="librarian")
+        librarians.permissions.set(Permission.objects.filter(
+            content_type__app_label__in=["baseApp", "auth"]
+        ))
+        cls.librarian = User.objects.create_user("librarian", password="secret")
+        cls.librarian.groups.add(librarians)
+        cls.token = Token.objects.create(user=cls.librarian)
+        cls.admin = User.objects.create_superuser("admin", password="secret")
+
+    def setUp(self):
+        self.counter = 0
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        share_connection_with_logins(self)
+
+    # ---------------- Data ---------------- #
+
+    def unique(self):
+        self.counter += 1
+        return self.counter
+
+    def make_genre(self):
+        return Genre.objects.create(name=f"Genre {self.unique()}")
+
+    def make_book(self, available_copies=4):
+        number = self.unique()
+        return Book.objects.create(
+            title=f"Book {number}", author=f"Author {number}", genre=self.make_genre(),
+            isbn=f"isbn-{number}", total_copies=5, available_copies=available_copies,
+        )
+
+    def make_member(self):
+        member = User.objects.create_user(f"member{self.unique()}", password="secret")
+        member.groups.add(Group.objects.get(name="member"))
+        return member
+
+    def make_record(self, status="BORROWED", days_ago=1):
+        today = timezone.now().date()
+        return BorrowRecord.objects.create(
+            book=self.make_book(), member=self.make_member(), status=status,
+            borrow_date=today - timedelta(days=days_ago + 7),
+            due_date=today - timedelta(days=days_ago),
+        )
+
+    def make_hold(self):
+        return Reservation.place(self.make_book(available_copies=0), self.make_member())
+
+    def book_data(self):
+        number = self.unique()
+        return {
+            "title": f"Book {number}", "author": "Someone", "genre": self.make_genre().pk,
+            "isbn": f"isbn-{number}", "total_copies": 3, "available_copies": 2,
+        }
+
+    def record_data(self):
+        return {
+            "book": self.make_book().pk, "member": self.make_member().pk,
+            "due_date": str(timezone.now().date() + timedelta(days=7)),
+        }
+
+
+class QueryBudgetTests(LibraryTestCase):
+    """
+    Exercises every route in urls.py and checks its number of SQL queries.
+    """
+
+    def grow(self, count):
+        for _ in range(count):
+            self.make_record()
+            self.make_record(status="OVERDUE")
+            self.make_hold()
+
+    def request_for(self, method, name):
+        """
+        Returns (url kwargs, request body) for one call of a route,
+        creating fresh target objects so repeated calls never collide.
+        """
+        if name == "genre-list":
+            return {}, {"name": f"Genre {self.unique()}"}
+        if name == "genre-detail":
+            return {"pk": self.make_genre().pk}, {"name": f"Genre {self.unique()}"}
+        if name == "book-list":
+            return {}, self.book_data()
+        if name == "book-detail":
+            return {"pk": self.make_book().pk}, self.book_data()
+        if name == "book-availability":
+            books = list(Book.objects.values_list("id", "isbn"))
+            ids, isbns = [book[0] for book in books[::2]], [book[1] for book in books[1::2]]
+            if method == "GET":
+                return {}, {"ids": ",".join(map(str, ids)), "isbns": ",".join(isbns)}
+            return {}, {"ids": ids, "isbns": isbns}
+        if name == "book-inventory":
+            return {}, {"books": [
+                {"id": book_id, "total_copies_delta": 2, "available_copies_delta": 1}
+                for book_id in Book.objects.values_list("id", flat=True)
+            ]}
+        if name == "book-typeahead":
+            typeahead.reset()  # measure the index build
+            return {}, {"q": "book"}
+        if name == "book-recommendations":
+            book = self.make_book()
+            BookRecommendation.objects.bulk_create(
+                BookRecommendation(book=book, recommended=other, score=1 / rank, rank=rank)
+                for rank, other in enumerate(Book.objects.exclude(pk=book.pk)[:10], start=1)
+            )
+            return {"pk": book.pk}, None
+        if name == "borrowrecord-list":
+            return {}, self.record_data()
+        if name == "borrowrecord-detail":
+            return {"pk": self.make_record().pk}, self.record_data()
+        if name == "borrowrecord-history":
+            self.make_record(status="RETURNED", days_ago=400)
+            ArchivedBorrowRecord.archive(timezone.now().date())
+            return {}, None
+        if name in ("borrowrecord-mark-as-returned", "borrowrecord-mark-as-overdue"):
+            return {"pk": self.make_record().pk}, None
+        if name == "hold-list":
+            return {}, {"book": self.make_book(available_copies=0).pk, "member": self.make_member().pk}
+        if name in ("hold-detail", "hold-position"):
+            return {"pk": self.make_hold().pk}, None
+        if name == "fine-member":
+            return {"pk": self.make_record(status="OVERDUE").member_id}, None
+        if name == "fine-record":
+            return {"pk": self.make_record(status="OVERDUE").pk}, None
+        if name == "finerule-list":
+            return {}, {"genre": self.make_genre().pk, "daily_rate": "0.50", "grace_days": 2}
+        if name == "finerule-detail":
+            rule = FineRule.objects.create(genre=self.make_genre(), daily_rate="0.50")
+            return {"pk": rule.pk}, {"genre": rule.genre_id, "daily_rate": "1.00", "cap": "5.00"}
+        if name == "register":
+            return {}, {"username": f"new{self.unique()}", "password": "secret"}
+        if name == "login":
+            return {}, {"username": self.make_member().username, "password": "secret"}
+        if name == "member-detail":
+            return {"pk": self.make_member().pk}, None
+        return {}, None
+
+    # ---------------- Measuring ---------------- #
+
+    def run_route(self, method, name):
+        kwargs, data = self.request_for(method, name)
+        if method in ("GET", "DELETE") and name not in QUERY_STRING_ROUTES:
+            data = None  # would otherwise end up as filters in the query string
+        if name.startswith("admin:"):
+            self.client.force_login(self.admin)
+        # measure the cold path, not cached fines or availability left by the previous call
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method.lower())(
+                reverse(name, kwargs=kwargs), data, format="json"
+            )
+        if name.startswith("admin:"):
+            self.client.logout()  # also drops the token credentials
+            self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        self.assertLess(
+            response.status_code, 400,
+            f"{method} {name} failed: {getattr(response, 'data', response.content)}",
+        )
+        return [query["sql"] for query in context.captured_queries]
+
+    def assertQueryBudget(self, method, name):
+        budget = QUERY_BUDGETS[(method, name)]
+        self.grow(SMALL)
+        small = self.run_route(method, name)
+        self.grow(LARGE - SMALL)
+        large = self.run_route(method, name)
+
+        if len(small) != len(large):
+            diff = "\n".join(difflib.unified_diff(
+                [normalize_sql(sql) for sql in small], [normalize_sql(sql) for sql in large],
+                fromfile=f"{SMALL} of each", tofile=f"{LARGE} of each", lineterm="",
+            ))
+            self.fail(
+                f"{method} {name}: query count grows with data "
+                f"({len(small)} -> {len(large)}):\n{diff}"
+            )
+        if len(large) > budget:
+            self.fail(
+                f"{method} {name}: {len(large)} queries, budget is {budget}:\n"
+                f"{format_queries(large)}"
+            )
+
+    def test_every_route_has_a_budget(self):
+        names = set()
+        for pattern in get_resolver().url_patterns:
+            if isinstance(pattern, URLPattern) and pattern.name:
+                names.add(pattern.name)
+            elif isinstance(pattern, URLResolver) and pattern.namespace:
+                names.add(f"{pattern.namespace}:index")
+        missing = names - {name for _, name in QUERY_BUDGETS}
+        self.assertFalse(missing, f"Routes without a query budget: {sorted(missing)}")
+
+
+def make_budget_test(method, name):
+    def test(self):
+        self.assertQueryBudget(method, name)
+    return test
+
+
+# One test per route, so every measurement starts from an empty database.
+for _method, _name in QUERY_BUDGETS:
+    setattr(
+        QueryBudgetTests,
+        f"test_budget_{_method.lower()}_{re.sub(r'[^a-z]+', '_', _name)}",
+        make_budget_test(_method, _name),
+    )
+
+
+# ---------------- Synthetic data ---------------- #
+
+@skipUnless(importlib.util.find_spec("numpy"), "seed_library needs numpy.")
+class SeedLibraryTests(TestCase):
+    def seed(self, **options):
+        options = {"genres": 3, "books": 40, "members": 15, "records": 2000, "days": 60, **options}
+        call_command("seed_library", stdout=StringIO(), **options)
+
+    def test_available_copies_match_active_loans(self):
+        self.seed()
+        books = Book.objects.annotate(
+            active=Count("borrowrecord", filter=Q(borrowrecord__status__in=["BORROWED", "OVERDUE"]))
+        )
+        self.assertEqual(books.count(), 40)
+        self.assertEqual(BorrowRecord.objects.count(), 2000)
+        for book in books:
+            self.assertEqual(book.total_copies - book.available_copies, book.active, book.title)
+            self.assertGreaterEqual(book.available_copies, 0)
+        # the bestsellers run out, so loans that wanted to stay out were returned instead
+        self.assertTrue(books.filter(available_copies=0).exists())
+
+        today = timezone.now().date()
+        self.assertFalse(BorrowRecord.objects.filter(status="OVERDUE", due_date__gte=today).exists())
+        self.assertFalse(BorrowRecord.objects.filter(status="BORROWED", due_date__lt=today).exists())
+        self.assertFalse(BorrowRecord.objects.filter(status="RETURNED", return_date__isnull=True).exists())
+
+    def test_same_seed_gives_same_rows(self):
+        def seeded(**options):
+            first = {model: (model.objects.order_by("pk").last() or model(pk=0)).pk + 1 for model in (Book, User)}
+            first_record = BorrowRecord.objects.count()
+            self.seed(seed=7, records=12000, **options)  # more than one generation chunk
+            return [
+                (book - first[Book], member - first[User], *rest)  # ids continue after the first run
+                for book, member, *rest in BorrowRecord.objects.order_by("pk")[first_record:].values_list(
+                    "book", "member", "borrow_date", "due_date", "return_date", "status",
+                )
+            ]
+
+        self.assertEqual(seeded(), seeded(batch_size=999))
+
+
+# ---------------- Login ---------------- #
+
+class LoginTests(LibraryTestCase):
+    """
+    Lockout, authenticate() and tokens of /login/.
+    """
+
+    def setUp(self):
+        super().setUp()
+        logins.reset()
+        cache.clear()  # token keys cached for users of earlier tests, whose ids come back
+        self.client.credentials()  # anonymous, as a login is
+        self.member, self.url = self.make_member(), reverse("login")
+
+    def login(self, password="secret"):
+        return self.client.post(self.url, {"username": self.member.username, "password": password})
+
+    def test_locks_out_after_failures(self):
+        for _ in range(settings.LOGIN_MAX_FAILURES):
+            self.assertEqual(self.login("wrong").status_code, 401)
+        with CaptureQueriesContext(connection) as context:
+            response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+        self.assertEqual(len(context), 0)  # refused before the user is even read
+
+    def test_failures_reach_auth_signals(self):
+        failed = mock.Mock()
+        user_login_failed.connect(failed)
+        self.addCleanup(user_login_failed.disconnect, failed)
+        self.assertEqual(self.login("wrong").status_code, 401)
+        self.assertEqual(failed.call_count, 1)
+        self.assertEqual(failed.call_args.kwargs["credentials"]["username"], self.member.username)
+
+    def test_sheds_load_when_checks_are_waiting(self):
+        _, admitted = logins._gates()
+        taken = 0
+        while admitted.acquire(blocking=False):
+            taken += 1
+        try:
+            self.assertEqual(self.login().status_code, 503)
+        finally:
+            for _ in range(taken):
+                admitted.release()
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_reuses_token_until_it_is_deleted(self):
+        first = self.login()
+        with CaptureQueriesContext(connection) as context:
+            second = self.login()
+        self.assertEqual(second.json()["token"], first.json()["token"])
+        self.assertEqual(len(context), 1)  # the user, the token comes from the cache
+        with self.captureOnCommitCallbacks(execute=True):
+            Token.objects.filter(user=self.member).delete()
+        self.assertIsNone(cache.get(logins.token_cache_key(self.member.pk)))
+        third = self.login()
+        self.assertNotEqual(third.json()["token"], first.json()["token"])
+
+    def test_password_is_checked_off_the_request_thread(self):
+        threads = []
+
+        def check(*args, **kwargs):
+            threads.append(threading.current_thread())
+            return authenticate(*args, **kwargs)
+
+        with mock.patch.object(logins, "authenticate", side_effect=check):
+            self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    def test_inactive_user_is_refused(self):
+        self.member.is_active = False
+        self.member.save()
+        self.assertEqual(self.login().status_code, 401)
+
+
+# ---------------- Holds ---------------- #
+
+class HoldQueueTests(LibraryTestCase):
+    """
+    Holds are served first come, first served when a copy is returned.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.book = self.make_book(available_copies=0)
+        self.loans = [BorrowRecord.objects.create(book=self.book, member=self.make_member()) for _ in range(3)]
+        self.holds = [Reservation.place(self.book, self.make_member()) for _ in range(3)]
+
+    def refresh(self, *objects):
+        for obj in objects:
+            obj.refresh_from_db()
+
+    def test_holds_are_served_in_order(self):
+        self.assertEqual([hold.queue_position() for hold in self.holds], [1, 2, 3])
+        self.assertEqual(Reservation.objects.next_in_line(self.book), self.holds[0])
+
+        self.loans[0].mark_as_returned()
+        self.loans[1].mark_as_returned()
+        self.refresh(self.book, *self.holds)
+        self.assertEqual([hold.status for hold in self.holds], ["FULFILLED", "FULFILLED", "WAITING"])
+        self.assertEqual(self.holds[2].queue_position(), 1)
+        # each copy went to a member in the queue, none back on the shelf
+        self.assertEqual(self.book.available_copies, 0)
+        for hold in self.holds[:2]:
+            self.assertEqual(
+                (hold.borrow_record.book_id, hold.borrow_record.member_id, hold.borrow_record.status),
+                (self.book.pk, hold.member_id, "BORROWED"),
+            )
+
+    def test_cancelled_and_expired_holds_are_skipped(self):
+        response = self.client.delete(reverse("hold-detail", kwargs={"pk": self.holds[0].pk}))
+        self.assertEqual(response.status_code, 204)
+        Reservation.objects.filter(pk=self.holds[1].pk).update(expires_at=timezone.now())
+        self.refresh(*self.holds)
+        self.assertEqual(self.holds[0].status, "CANCELLED")  # kept for history
+        self.assertEqual(self.holds[2].queue_position(), 1)
+
+        self.loans[0].mark_as_returned()
+        self.refresh(*self.holds)
+        self.assertEqual([hold.status for hold in self.holds], ["CANCELLED", "EXPIRED", "FULFILLED"])
+
+        # with nobody waiting, the next copy goes back on the shelf
+        self.loans[1].mark_as_returned()
+        self.refresh(self.book)
+        self.assertEqual(self.book.available_copies, 1)
+
+    def test_a_loan_is_returned_only_once(self):
+        Reservation.objects.update(status="CANCELLED")
+        stale = BorrowRecord.objects.get(pk=self.loans[0].pk)
+        self.loans[0].mark_as_returned()
+        stale.mark_as_returned()  # a second, concurrent return of the same loan
+        self.refresh(self.book)
+        self.assertEqual(self.book.available_copies, 1)
+        self.assertEqual(stale.status, "RETURNED")
+
+    def test_moving_a_loan_moves_its_copy(self):
+        other = self.make_book(available_copies=1)
+        url = reverse("borrowrecord-detail", kwargs={"pk": self.loans[0].pk})
+        data = {"book": other.pk, "member": self.loans[0].member_id, "due_date": str(self.loans[0].due_date)}
+        self.assertEqual(self.client.put(url, data, format="json").status_code, 200)
+        self.refresh(self.book, other, self.holds[0])
+        self.assertEqual(other.available_copies, 0)
+        self.assertEqual(self.book.available_copies, 0)  # the freed copy went to the queue
+        self.assertEqual(self.holds[0].status, "FULFILLED")
+
+        # no copy of the new book left, nothing changes
+        data["book"] = other.pk
+        url = reverse("borrowrecord-detail", kwargs={"pk": self.loans[1].pk})
+        self.assertEqual(self.client.put(url, data, format="json").status_code, 400)
+        self.refresh(self.loans[1], self.holds[1])
+        self.assertEqual((self.loans[1].book_id, self.holds[1].status), (self.book.pk, "WAITING"))
+
+    def test_deleting_a_loan_frees_its_copy(self):
+        Reservation.objects.update(status="CANCELLED")
+        url = reverse("borrowrecord-detail", kwargs={"pk": self.loans[0].pk})
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.loans[1].mark_as_returned()
+        returned = self.loans[1]
+        self.assertEqual(self.client.delete(reverse("borrowrecord-detail", kwargs={"pk": returned.pk})).status_code, 204)
+        self.refresh(self.book)
+        self.assertEqual(self.book.available_copies, 2)  # the returned loan's copy is not freed twice
+
+
+# ---------------- Change feed ---------------- #
+
+class ChangeFeedTests(LibraryTestCase):
+    """
+    Mirrors replay /changes/ page by page and end in the current state.
+    """
+
+    def feed(self, **params):
+        response = self.client.get(reverse("change-feed"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def settle(self):
+        ChangeLog.objects.update(created_at=timezone.now() - timedelta(hours=1))
+
+    def test_pages_follow_the_cursor(self):
+        genre = self.make_genre()
+        book = self.make_book()
+        genre.name = "Renamed"
+        genre.save()
+        self.settle()
+
+        first = self.feed(limit=2)
+        self.assertTrue(first["has_more"])
+        self.assertEqual(
+            [(entry["model"], entry["action"]) for entry in first["results"]],
+            [("genre", "create"), ("genre", "create")],
+        )
+        rest = self.feed(since=first["next_cursor"])
+        self.assertFalse(rest["has_more"])
+        self.assertEqual(
+            [(entry["model"], entry["object_id"], entry["action"]) for entry in rest["results"]],
+            [("book", book.pk, "create"), ("genre", genre.pk, "update")],
+        )
+        self.assertEqual(rest["results"][-1]["data"]["name"], "Renamed")
+        self.assertEqual(self.feed(since=rest["next_cursor"])["results"], [])
+
+        books = self.feed(model="book")["results"]
+        self.assertEqual([entry["object_id"] for entry in books], [book.pk])
+        self.assertEqual(self.client.get(reverse("change-feed"), {"limit": 0}).status_code, 400)
+
+    def test_recent_changes_do_not_advance_the_cursor(self):
+        self.make_genre()
+        self.settle()
+        settled = self.feed()["next_cursor"]
+        genre = self.make_genre()  # could be followed by a lower id that commits later
+
+        page = self.feed(since=settled)
+        self.assertEqual([entry["object_id"] for entry in page["results"]], [genre.pk])
+        self.assertEqual(page["next_cursor"], settled)
+        self.assertFalse(page["has_more"])
+        self.settle()
+        self.assertEqual(self.feed(since=settled)["next_cursor"], page["results"][0]["cursor"])
+
+    def test_compaction_keeps_the_latest_entry_of_each_object(self):
+        kept, deleted = self.make_genre(), self.make_genre()
+        for name in ("Second", "Third"):
+            kept.name = name
+            kept.save()
+        deleted_id = deleted.pk
+        deleted.delete()
+
+        removed = ChangeLog.compact(timezone.now() + timedelta(seconds=1))
+        self.assertEqual(removed, 3)  # two older versions of kept, the create of deleted
+        self.assertEqual(
+            list(ChangeLog.objects.order_by("id").values_list("object_id", "action")),
+            [(kept.pk, "update"), (deleted_id, "delete")],
+        )
+        self.assertEqual(ChangeLog.objects.get(object_id=kept.pk).data["name"], "Third")
+
+
+# ---------------- Job queue ---------------- #
+
+class JobQueueTests(TestCase):
+    """
+    Enqueue, claim, fail and retry with the task registry of baseApp/jobs.py.
+    Claims go through SKIP LOCKED where the backend has it, and through the
+    conditional UPDATE fallback on SQLite.
+    """
+
+    def setUp(self):
+        self.calls = []
+        jobs.task("test_task")(self.task)
+        self.addCleanup(jobs.TASKS.pop, "test_task")
+
+    def task(self, fail=False):
+        self.calls.append(fail)
+        if fail:
+            raise RuntimeError("task failed")
+
+    def test_unknown_tasks_are_refused(self):
+        with self.assertRaises(ValueError):
+            jobs.enqueue("no_such_task")
+
+    def test_a_job_is_claimed_by_one_worker(self):
+        due = jobs.enqueue("test_task")
+        later = jobs.enqueue("test_task", delay=60)
+
+        claimed = jobs.claim("worker-1", limit=10)
+        self.assertEqual(claimed, [due])
+        self.assertEqual(
+            (claimed[0].status, claimed[0].locked_by, claimed[0].attempts), (Job.RUNNING, "worker-1", 1)
+        )
+        self.assertEqual(jobs.claim("worker-2", limit=10), [])  # not due, or taken
+        later.refresh_from_db()
+        self.assertEqual(later.status, Job.QUEUED)
+
+        self.assertEqual(jobs.run(claimed[0]), Job.DONE)
+        due.refresh_from_db()
+        self.assertEqual((due.status, due.locked_by), (Job.DONE, ""))
+        self.assertIsNotNone(due.finished_at)
+        self.assertEqual(self.calls, [False])
+
+    def test_failures_are_retried_with_backoff_then_recorded(self):
+        job = jobs.enqueue("test_task", {"fail": True}, max_attempts=2)
+
+        before = timezone.now()
+        self.assertEqual(jobs.run(jobs.claim("worker", limit=1)[0]), Job.QUEUED)
+        job.refresh_from_db()
+        self.assertIn("RuntimeError: task failed", job.last_error)
+        self.assertGreaterEqual(job.run_at, before + timedelta(seconds=jobs.RETRY_BACKOFF))
+        self.assertEqual(jobs.claim("worker", limit=1), [])  # still backing off
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        retried = jobs.claim("worker", limit=1)[0]
+        self.assertEqual(retried.attempts, 2)
+        self.assertEqual(jobs.run(retried), Job.FAILED)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(self.calls, [True, True])
+
+    def test_jobs_of_a_dead_worker_are_requeued(self):
+        job = jobs.enqueue("test_task")
+        jobs.claim("worker", limit=1)
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(seconds=jobs.STALE_AFTER + 1))
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(jobs.claim("worker-2", limit=1)[0].attempts, 2)
+
+    def test_a_job_out_of_attempts_is_not_requeued(self):
+        job = jobs.enqueue("test_task", max_attempts=1)
+        jobs.claim("worker", limit=1)
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(seconds=jobs.STALE_AFTER + 1))
+        self.assertEqual(jobs.requeue_stale(), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (Job.FAILED, ""))
+        self.assertIn("stopped responding", job.last_error)
+
+    def test_a_long_job_keeps_its_claim(self):
+        jobs.enqueue("test_task")
+        job = jobs.claim("worker", limit=1)[0]
+        touched = threading.Event()
+        with mock.patch.object(jobs, "HEARTBEAT", 0.01), \
+                mock.patch.object(jobs, "touch", side_effect=lambda job: touched.set() or True):
+            jobs.task("test_task")(lambda: touched.wait(5))
+            self.assertEqual(jobs.run(job), Job.DONE)
+        self.assertTrue(touched.is_set())
+
+        # touching refreshes locked_at only under the job's own claim
+        jobs.enqueue("test_task")
+        job = jobs.claim("worker", limit=1)[0]
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(minutes=5))
+        self.assertTrue(jobs.touch(job))
+        self.assertGreater(Job.objects.get(pk=job.pk).locked_at, timezone.now() - timedelta(minutes=1))
+        Job.objects.filter(pk=job.pk).update(attempts=F("attempts") + 1)
+        self.assertFalse(jobs.touch(job))
+
+    def test_a_requeued_job_is_left_to_its_new_worker(self):
+        jobs.enqueue("test_task")
+        first = jobs.claim("worker", limit=1)[0]
+        Job.objects.filter(pk=first.pk).update(locked_at=timezone.now() - timedelta(seconds=jobs.STALE_AFTER + 1))
+        jobs.requeue_stale()
+        second = jobs.claim("worker", limit=1)[0]  # same worker name, a new attempt
+
+        self.assertIsNone(jobs.run(first))
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.locked_by, second.attempts), (Job.RUNNING, "worker", 2))
+        self.assertEqual(jobs.run(second), Job.DONE)
+        self.assertEqual(self.calls, [False, False])
+
+
+# ---------------- Fines ---------------- #
+
+@override_settings(FINE_DEFAULT_RULE={"daily_rate": "0.25", "grace_days": 0, "cap": "10.00"})
+class FineTests(LibraryTestCase):
+    """
+    Rate, grace period and cap per genre, with the default rule for the rest.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.today = timezone.now().date()
+        self.strict = self.make_genre()
+        FineRule.objects.create(genre=self.strict, daily_rate="1.00", grace_days=2, cap="5.00")
+        self.member = self.make_member()
+
+    def loan(self, genre, days_late, status="BORROWED"):
+        number = self.unique()
+        book = Book.objects.create(
+            title=f"Book {number}", author="Someone", genre=genre,
+            isbn=f"isbn-{number}", total_copies=1, available_copies=0,
+        )
+        return BorrowRecord.objects.create(
+            book=book, member=self.member, status=status,
+            borrow_date=self.today - timedelta(days=days_late + 14),
+            due_date=self.today - timedelta(days=days_late),
+        )
+
+    def test_rate_grace_and_cap(self):
+        in_grace = self.loan(self.strict, 2)
+        charged = self.loan(self.strict, 5)
+        capped = self.loan(self.strict, 30)
+        default = self.loan(self.make_genre(), 3)
+        no_genre = self.loan(None, 60)
+        self.loan(self.strict, 9, status="RETURNED")
+        self.loan(self.strict, -3)  # not due yet
+
+        snapshot = fines.compute(self.today)
+        self.assertEqual(snapshot.for_record(in_grace.pk)["amount"], "0.00")
+        self.assertEqual(snapshot.for_record(charged.pk), {
+            "record": charged.pk, "member": self.member.pk, "days_late": 3, "amount": "3.00",
+        })
+        self.assertEqual(snapshot.for_record(capped.pk)["amount"], "5.00")
+        self.assertEqual(snapshot.for_record(default.pk)["amount"], "0.75")
+        self.assertEqual(snapshot.for_record(no_genre.pk)["amount"], "10.00")
+        self.assertEqual(
+            snapshot.balance_list(), [{"member": self.member.pk, "total": "18.75", "records": 4}]
+        )
+
+    def test_numpy_and_python_give_the_same_fines(self):
+        genres = [self.strict, self.make_genre(), None]
+        for days_late in range(-2, 40, 3):
+            self.loan(genres[days_late % 3], days_late)
+        vectorized = fines.compute(self.today)
+        with mock.patch.object(fines, "numpy", return_value=None):
+            python = fines.compute(self.today)
+        self.assertEqual(python.balance_list(), vectorized.balance_list())
+        self.assertEqual(python.for_member(self.member.pk), vectorized.for_member(self.member.pk))
+
+    def test_only_rule_changes_start_a_new_computation(self):
+        record = self.loan(self.strict, 5)
+        fines.invalidate()  # not a snapshot left by another test
+        first = fines.current()
+        with self.captureOnCommitCallbacks(execute=True):
+            record.mark_as_returned()
+            self.loan(self.strict, 4)
+        self.assertIs(fines.current(), first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            FineRule.objects.filter(genre=self.strict).get().save()
+        self.assertIsNot(fines.current(), first)
+
+    def test_the_rules_version_outlives_culling_of_the_default_cache(self):
+        project_caches(self)
+        version = fines.rules_version()
+        cache.clear()  # the worst a full file cache does to its entries
+        self.assertEqual(fines.rules_version(), version)
+
+
+# ---------------- Typeahead ---------------- #
+
+class TypeaheadTests(LibraryTestCase):
+    """
+    Suggestions from the in-memory prefix index, and the database fallback
+    used while it is being built.
+    """
+
+    def test_suggestions_are_served_from_memory(self):
+        typeahead.reset()
+        for _ in range(12):
+            self.make_record()
+        url = reverse("book-typeahead")
+        self.client.get(url, {"q": "boo"})  # builds the index
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {"q": "book", "types": "book"})
+        self.assertEqual(len(context), 1)  # the token lookup
+        self.assertEqual(len(response.data["results"]), 10)
+        typeahead.reset()
+
+    def test_limit_must_be_positive(self):
+        url = reverse("book-typeahead")
+        for index in (None, typeahead.get_index(wait=True)):
+            typeahead.reset()
+            with mock.patch.object(typeahead, "get_index", return_value=index):
+                for limit in ("0", "-1"):
+                    with self.subTest(index=index, limit=limit):
+                        response = self.client.get(url, {"q": "book", "limit": limit})
+                        self.assertEqual(response.status_code, 400)
+        typeahead.reset()
+
+
+# ---------------- Availability ---------------- #
+
+class AvailabilityTests(LibraryTestCase):
+    """
+    Bulk lookups by id or ISBN, and the cache that loans keep current.
+    """
+
+    def test_repeated_lookups_are_served_from_the_cache(self):
+        caches["availability"].clear()
+        books = [self.make_book() for _ in range(LARGE)]
+        url = reverse("book-availability")
+        data = {"ids": [book.pk for book in books], "isbns": ["unknown"]}
+        with CaptureQueriesContext(connection) as cold:
+            self.client.post(url, data, format="json")
+        with CaptureQueriesContext(connection) as warm:
+            response = self.client.post(url, data, format="json")
+        self.assertEqual(len(warm), len(cold) - 1)  # only the token lookup is left
+        self.assertEqual(len(response.data["results"]), LARGE)
+        self.assertEqual(response.data["missing"], {"ids": [], "isbns": ["unknown"]})
+
+    def test_loans_update_the_cached_counts(self):
+        caches["availability"].clear()
+        book = self.make_book(available_copies=1)
+        url = reverse("book-availability")
+        self.client.get(url, {"ids": str(book.pk)})  # cached with one copy left
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("borrowrecord-list"), {
+                "book": book.pk, "member": self.make_member().pk,
+                "due_date": str(timezone.now().date() + timedelta(days=7)),
+            })
+        self.assertEqual(response.status_code, 201)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {"ids": str(book.pk)})
+        self.assertEqual(len(context), 1)  # the token lookup
+        self.assertEqual(response.data["results"][0]["available_copies"], 0)
+
+    def test_project_caches_hold_a_whole_lookup(self):
+        project_caches(self)
+        isbns = [self.make_book().isbn for _ in range(200)]
+        availability.lookup(isbns=isbns)
+        with CaptureQueriesContext(connection) as context:
+            found = availability.lookup(isbns=isbns)
+        self.assertEqual(len(found["isbns"]), 200)
+        if isinstance(caches["availability"], DummyCache):
+            self.assertEqual(len(context), 1)  # no Redis: the single query, every time
+        else:
+            self.assertEqual(len(context), 0)  # none of the 400 entries pushed out
+
+
+# ---------------- Inventory ---------------- #
+
+class InventoryTests(LibraryTestCase):
+    """
+    Copy counts are checked by the book_available_lte_total constraint.
+    """
+
+    def test_inventory_update_is_checked_by_the_database(self):
+        first, second = self.make_book(available_copies=4), self.make_book(available_copies=4)
+        url = reverse("book-inventory")
+        response = self.client.patch(url, {"books": [
+            {"id": first.pk, "total_copies": 10, "available_copies_delta": 3},
+            {"id": second.pk, "available_copies_delta": 2},  # 6 of 5 copies
+            {"id": 0, "total_copies": 1},
+        ]}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["invalid"], [second.pk])
+        self.assertEqual(response.data["missing"], [0])
+        first.refresh_from_db()
+        self.assertEqual((first.total_copies, first.available_copies), (5, 4))  # rolled back
+
+        response = self.client.patch(url, {"books": [
+            {"id": first.pk, "total_copies": 10, "available_copies_delta": 3},
+            {"id": second.pk, "total_copies_delta": -1},
+        ]}, format="json")
+        self.assertEqual(response.data, {"updated": 2})
+        self.assertEqual(
+            list(Book.objects.order_by("id").values_list("total_copies", "available_copies")), [(10, 7), (4, 4)]
+        )
+        self.assertEqual(ChangeLog.objects.filter(model="book", object_id=first.pk).last().data["total_copies"], 10)
+
+        # a partial update through the detail route compares with the stored count
+        response = self.client.patch(reverse("book-detail", kwargs={"pk": second.pk}), {"available_copies": 5})
+        self.assertEqual(response.status_code, 400)
+
+    def test_returning_a_legacy_loan_cannot_exceed_the_total(self):
+        # a loan made before the constraint, on a book whose count was already full
+        book = self.make_book(available_copies=5)
+        record = BorrowRecord.objects.create(book=book, member=self.make_member())
+        response = self.client.post(reverse("borrowrecord-mark-as-returned", kwargs={"pk": record.pk}))
+        self.assertEqual(response.status_code, 200)
+        book.refresh_from_db()
+        self.assertEqual((book.available_copies, book.total_copies), (5, 5))
+
+
+# ---------------- Idempotency keys ---------------- #
+
+@override_settings(IDEMPOTENCY_WAIT=0)
+class IdempotencyTests(LibraryTestCase):
+    """
+    Retries with an Idempotency-Key header replay the first response.
+    """
+
+    def test_idempotency_key_replays_the_first_response(self):
+        url, data = reverse("borrowrecord-list"), self.record_data()
+        first = self.client.post(url, data, format="json", HTTP_IDEMPOTENCY_KEY="loan-1")
+        with CaptureQueriesContext(connection) as context:
+            retry = self.client.post(url, data, format="json", HTTP_IDEMPOTENCY_KEY="loan-1")
+        self.assertEqual((retry.status_code, retry.data), (first.status_code, first.data))
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(BorrowRecord.objects.count(), 1)
+        self.assertFalse([query for query in context.captured_queries if "baseApp_b" in query["sql"]])
+
+        reused = self.client.post(url, self.record_data(), format="json", HTTP_IDEMPOTENCY_KEY="loan-1")
+        self.assertEqual(reused.status_code, 422)
+
+        # a retry while the first request still runs waits, here not at all
+        IdempotencyKey.objects.create(
+            scope=f"user:{self.librarian.pk}", key="loan-2", fingerprint=idempotency.fingerprint(
+                type("Request", (), {"data": data, "method": "POST", "path": url})
+            ), expires_at=timezone.now() + timedelta(days=1),
+        )
+        running = self.client.post(url, data, format="json", HTTP_IDEMPOTENCY_KEY="loan-2")
+        self.assertEqual(running.status_code, 409)
+        self.assertEqual(BorrowRecord.objects.count(), 1)
+
+    def test_registration_keys_are_per_client_and_keep_no_secrets(self):
+        self.client.credentials()  # anonymous, as a registration is
+        url, data = reverse("register"), {"username": "newcomer", "password": "pw-secret"}
+        first = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="signup", REMOTE_ADDR="10.0.0.1")
+        retry = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="signup", REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual((retry.data, retry["Idempotent-Replayed"]), (first.data, "true"))
+        self.assertNotIn("password", first.data)
+
+        stored = IdempotencyKey.objects.get()
+        self.assertEqual(stored.scope, "anon:10.0.0.1")
+        self.assertNotIn("password", stored.response)
+        plain = hashlib.sha256(f"POST {url}\n{json.dumps(data, sort_keys=True)}".encode()).hexdigest()
+        self.assertNotEqual(stored.fingerprint, plain)
+
+        # another client reusing the key is a new request, not a replay of someone else's
+        other = self.client.post(
+            url, {"username": "someone", "password": "pw-other"}, HTTP_IDEMPOTENCY_KEY="signup", REMOTE_ADDR="10.0.0.2",
+        )
+        self.assertEqual(other.status_code, 201)
+        self.assertEqual(other.data["username"], "someone")
+
+    @override_settings(IDEMPOTENCY_WAIT=0.3)
+    def test_a_key_taken_again_and_again_is_waited_for_with_backoff(self):
+        # every try finds the key released, and someone else holding it by the next one
+        with mock.patch.object(idempotency, "claim", return_value=(None, False)) as claim, \
+                mock.patch.object(idempotency.time, "sleep", wraps=idempotency.time.sleep) as sleep:
+            started = timezone.now()
+            self.assertEqual(idempotency.wait_for("user:1", "busy", "digest"), (None, False))
+            self.assertLess(timezone.now() - started, timedelta(seconds=1))
+        self.assertLess(claim.call_count, 10)
+        self.assertEqual(sleep.call_count, claim.call_count - 1)
+
+        with mock.patch.object(idempotency, "wait_for", return_value=(None, False)):
+            response = self.client.post(
+                reverse("borrowrecord-list"), self.record_data(), format="json", HTTP_IDEMPOTENCY_KEY="busy",
+            )
+        self.assertEqual(response.status_code, 409)
+
+
+# ---------------- Response size ---------------- #
+
+class ResponseSizeTests(LibraryTestCase):
+    """
+    ?fields= sparse fieldsets and negotiated compression (baseApp/middleware.py).
+    """
+
+    def test_sparse_fields_select_only_their_columns(self):
+        self.make_record()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("borrowrecord-list"), {"fields": "id,book_title,status"})
+        self.assertEqual(list(response.data["results"][0]), ["id", "book_title", "status"])
+        select = normalize_sql(context.captured_queries[-1]["sql"])
+        self.assertNotIn("due_date", select.split(" FROM ")[0])
+        self.assertNotIn("auth_user", select)  # member is not joined any more
+
+        response = self.client.get(reverse("book-list"), {"fields": "id,nope"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_large_responses_are_compressed(self):
+        for _ in range(LARGE):
+            self.make_book()
+        url = reverse("book-list")
+        plain = self.client.get(url, {"page_size": 100})
+        compressed = self.client.get(url, {"page_size": 100}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertLess(len(compressed.content), len(plain.content))
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        small = self.client.get(url, {"fields": "id"}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(small.has_header("Content-Encoding"))
+        refused = self.client.get(url, {"page_size": 100}, HTTP_ACCEPT_ENCODING="gzip;q=0, *")
+        self.assertFalse(refused.has_header("Content-Encoding"))
+
+        # BREACH: the same body compresses to different lengths over HTTPS too
+        lengths = {
+            len(self.client.get(url, {"page_size": 100}, HTTP_ACCEPT_ENCODING="gzip", secure=True).content)
+            for _ in range(5)
+        }
+        self.assertGreater(len(lengths), 1)
+
+    def test_encoding_follows_quality_values(self):
+        with mock.patch.object(middleware, "brotli", object()):
+            for header, secure, expected in [
+                ("gzip, br", False, "br"),
+                ("gzip;q=1.0, br;q=0.5", False, "gzip"),
+                ("br;q=0, *", False, "gzip"),
+                ("gzip;q=0, br;q=0, *", False, None),
+                ("*;q=0", False, None),
+                ("identity", False, None),
+                ("gzip, br", True, "gzip"),  # brotli has no BREACH padding
+                ("br", True, None),
+            ]:
+                with self.subTest(header=header, secure=secure):
+                    self.assertEqual(middleware.choose_encoding(header, secure), expected)
+
+
+# ---------------- Archive ---------------- #
+
+class ArchiveTests(LibraryTestCase):
+    """
+    Old returned loans move to ArchivedBorrowRecord; the history endpoint reads both tables.
+    """
+
+    def test_archive_moves_returned_loans(self):
+        old = [self.make_record(status="RETURNED", days_ago=400) for _ in range(5)]
+        for record in old:
+            BorrowRecord.objects.filter(pk=record.pk).update(return_date=record.due_date)
+        open_loan = self.make_record()
+        archived = ArchivedBorrowRecord.archive(timezone.now().date() - timedelta(days=365), batch_size=2)
+
+        self.assertEqual(archived, 5)
+        self.assertEqual(list(BorrowRecord.objects.values_list("id", flat=True)), [open_loan.pk])
+        self.assertEqual(
+            sorted(ArchivedBorrowRecord.objects.values_list("id", flat=True)), [record.pk for record in old]
+        )
+        response = self.client.get(reverse("borrowrecord-history"))
+        self.assertEqual(response.data["count"], 6)
+        self.assertEqual(response.data["results"][0]["id"], open_loan.pk)
+        self.assertTrue(all(loan["archived"] for loan in response.data["results"][1:]))
+        response = self.client.get(reverse("borrowrecord-history"), {"member": open_loan.member_id})
+        self.assertEqual([loan["id"] for loan in response.data["results"]], [open_loan.pk])
+
+    def test_recent_and_open_loans_stay(self):
+        recent = self.make_record(status="RETURNED", days_ago=10)
+        BorrowRecord.objects.filter(pk=recent.pk).update(return_date=recent.due_date)
+        self.make_record(status="OVERDUE", days_ago=400)
+        self.assertEqual(ArchivedBorrowRecord.archive(timezone.now().date() - timedelta(days=365)), 0)
+        self.assertEqual(BorrowRecord.objects.count(), 2)
+
+
+# ---------------- Recommendations ---------------- #
+
+@skipUnless(
+    importlib.util.find_spec("numpy") and importlib.util.find_spec("scipy"),
+    "Building recommendations needs numpy and scipy.",
+)
+class RecommendationTests(LibraryTestCase):
+    """
+    Co-borrow counts and cosine ranks on a small library, rebuilt in full
+    and updated incrementally.
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        matrix = override_settings(RECOMMENDATIONS_MATRIX=Path(directory.name) / "coborrow.npz")
+        matrix.enable()
+        self.addCleanup(matrix.disable)
+        self.a, self.b, self.c, self.d = (self.make_book() for _ in range(4))
+
+    def borrow(self, *books):
+        member = self.make_member()
+        for book in books:
+            BorrowRecord.objects.create(book=book, member=member, status="RETURNED")
+
+    def stored(self):
+        recommendations = {}
+        for book, recommended, score in BookRecommendation.objects.order_by("book", "rank").values_list(
+            "book", "recommended", "score"
+        ):
+            recommendations.setdefault(book, []).append((recommended, round(score, 3)))
+        return recommendations
+
+    def test_ranks_follow_cosine_similarity(self):
+        from . import recommendations
+
+        a, b, c, d = self.a.pk, self.b.pk, self.c.pk, self.d.pk
+        self.borrow(self.a, self.b, self.c)
+        self.borrow(self.a, self.b)
+        self.borrow(self.a, self.c)
+        self.borrow(self.b, self.d)
+        self.borrow(self.a, self.a)  # a second loan of the same book counts once
+        # borrowers a: 4, b: 3, c: 2; a-b and a-c: 2 members each, b-c and b-d: 1 (below MIN_COUNT)
+        recommendations.build(full=True)
+        self.assertEqual(self.stored(), {
+            a: [(c, round(2 / 8 ** 0.5, 3)), (b, round(2 / 12 ** 0.5, 3))],
+            b: [(a, round(2 / 12 ** 0.5, 3))],
+            c: [(a, round(2 / 8 ** 0.5, 3))],
+        })
+
+        self.borrow(self.b, self.c)  # b-c reaches 2, and b and c gain a borrower
+        recommendations.build()
+        incremental = self.stored()
+        self.assertEqual(incremental[b], [(c, round(2 / 12 ** 0.5, 3)), (a, round(2 / 16 ** 0.5, 3))])
+        # equal scores: the lower book id first
+        self.assertEqual(incremental[c], [(a, round(2 / 12 ** 0.5, 3)), (b, round(2 / 12 ** 0.5, 3))])
+
+        recommendations.build(full=True)
+        self.assertEqual(self.stored(), incremental)
+
+    def test_a_loan_committed_late_is_not_skipped(self):
+        from . import recommendations
+
+        self.borrow(self.a, self.b)
+        late = self.make_member()
+        late_id = BorrowRecord.objects.create(book=self.c, member=late, status="RETURNED").pk
+        self.borrow(self.a, self.b)
+        self.borrow(self.a, self.c)
+        BorrowRecord.objects.filter(pk=late_id).delete()  # its id is taken, but it is not committed yet
+        recommendations.build(full=True)
+        score = round(2 / 6 ** 0.5, 3)  # a: 3 borrowers, b: 2, a-c only 1 so far
+        self.assertEqual(self.stored(), {self.a.pk: [(self.b.pk, score)], self.b.pk: [(self.a.pk, score)]})
+
+        # committed after the build, with an id below the watermark
+        BorrowRecord.objects.create(pk=late_id, book=self.c, member=late, status="RETURNED")
+        BorrowRecord.objects.create(book=self.a, member=late, status="RETURNED")
+        recommendations.build()
+        incremental = self.stored()
+        self.assertEqual(incremental[self.c.pk], [(self.a.pk, round(2 / 8 ** 0.5, 3))])
+        recommendations.build(full=True)
+        self.assertEqual(self.stored(), incremental)
+
+        # read again, but nothing new: no book is recomputed
+        loans, books, rows = recommendations.build()
+        self.assertGreater(loans, 0)
+        self.assertEqual((books, rows), (0, 0))
+
+    def test_limit_must_be_positive(self):
+        url = reverse("book-recommendations", kwargs={"pk": self.a.pk})
+        self.assertEqual(self.client.get(url, {"limit": 1}).status_code, 200)
+        for limit in (0, -1):
+            self.assertEqual(self.client.get(url, {"limit": limit}).status_code, 400)
+
+
+# ---------------- Worker start-up ---------------- #
+
+class WarmUpTests(TestCase):
+    def test_does_not_query(self):
+        # it runs before a pre-forking server forks, a connection must not be opened yet
+        with CaptureQueriesContext(connection) as context:
+            self.assertGreater(startup.warm_up(), 0)
+        self.assertEqual(len(context), 0)
+
+
+# ---------------- Index usage ---------------- #
+
+# A plan line such as "SCAN baseApp_borrowrecord" (no index) means a full table scan.
+# "SCAN ... USING INDEX" walks an index in order and is fine for ordered, limited lists.
+FULL_SCAN = re.compile(r"\bSCAN (\w+)\s*$")
+
+
+@skipUnless(connection.vendor == "sqlite", "Query plans are checked against SQLite's EXPLAIN QUERY PLAN.")
+class IndexPlanTests(TestCase):
+    """
+    Runs EXPLAIN on the hot API queries and fails on a full table scan.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        members = Group.objects.create(name="member")
+        cls.member = User.objects.create_user("reader")
+        cls.member.groups.add(members)
+        cls.book = Book.objects.create(
+            title="Dune", author="Frank Herbert", isbn="9780441013593",
+            genre=Genre.objects.create(name="Fiction"), total_copies=2, available_copies=1,
+        )
+        BorrowRecord.objects.create(book=cls.book, member=cls.member)
+
+    def hot_queries(self):
+        today = timezone.now().date()
+        records = BorrowRecord.objects.select_related("book", "member")
+        return {
+            "borrow list, default ordering": records.order_by("-borrow_date")[:10],
+            "borrow list, ordered by due date": records.order_by("due_date")[:10],
+            "filter by member username": records.filter(member__username=self.member.username),
+            "filter by due date": records.filter(due_date=today),
+            "member's open loans": records.filter(member=self.member, status__in=ACTIVE_STATUSES),
+            "book's open loans": BorrowRecord.objects.filter(book=self.book, status__in=ACTIVE_STATUSES),
+            "overdue list": records.filter(status="OVERDUE").order_by("due_date"),
+            "overdue sweep": BorrowRecord.objects.filter(status="BORROWED", due_date__lt=today),
+            "archive sweep": BorrowRecord.objects.filter(status="RETURNED", return_date__lt=today)
+            .values_list("id", flat=True)[:1000],
+            "book by isbn": Book.objects.filter(isbn=self.book.isbn),
+            "book by author": Book.objects.filter(author=self.book.author),
+            "book by title": Book.objects.filter(title=self.book.title),
+            "books of a genre": Book.objects.filter(genre__name="Fiction"),
+            "member list": User.objects.filter(groups__name="member").order_by("id"),
+            "member's archived loans": ArchivedBorrowRecord.objects.filter(member=self.member)
+            .order_by("-borrow_date")[:10],
+            "book's archived loans": ArchivedBorrowRecord.objects.filter(book=self.book)
+            .order_by("-borrow_date")[:10],
+            "book recommendations": BookRecommendation.objects.filter(book=self.book)
+            .select_related("recommended").order_by("rank")[:10],
+        }
+
+    def test_hot_queries_use_indexes(self):
+        for name, queryset in self.hot_queries().items():
+            with self.subTest(query=name):
+                plan = queryset.explain()
+                scans = [line for line in plan.splitlines() if FULL_SCAN.search(line)]
+                self.assertFalse(scans, f"{name} does a full scan:\n{plan}\n\n{queryset.query}")
@@ -0,0 +1,463 @@
+"""
+In-process prefix index for search box autocomplete.
+
+Book titles, authors and genre names are normalized (lowercase, no accents
+or punctuation) and stored per kind as a sorted list of keys: one key for the
+start of the text and one for each following word, so "dune" finds
+"Children of Dune". A prefix is a bisect range in that list, and a max
+segment tree over the entries' popularity (number of loans) returns the most
+borrowed matches of the range in O(k log n), however many entries it covers.
+
+The index is built on first use (in a background thread by default; the
+endpoint falls back to the database until it is ready), then kept current by
+the model signals in baseApp/signals.py:
+- new texts go to a small sorted side list, merged into the main arrays
+  once it grows past MERGE_AFTER
+- popularity changes update the tree in O(log n)
+- removed entries get a popularity of -1 and are skipped
+
+The index belongs to one process, and the signals only fire in the process
+that made the change. Other worker processes keep serving the titles,
+authors and genres they loaded (and their loan counts) until they restart,
+so after editing or deleting a book every worker only agrees once the
+workers are restarted. New books and renames are usually rare enough for
+that to be acceptable; deploys restart the workers anyway.
+
+TYPEAHEAD_MAX_ENTRIES bounds the memory. Every text keeps the key of its
+start; word keys are added from the most popular texts down until the
+limit is reached.
+"""
+import heapq
+import re
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db.models import Count
+
+from .models import Book, BorrowRecord, Genre
+
+
+MAX_ENTRIES = getattr(settings, "TYPEAHEAD_MAX_ENTRIES", 3_000_000)
+KEY_LENGTH = 24  # longer queries are checked against the whole text
+MAX_WORDS = 6  # word keys per text, after the first word
+MERGE_AFTER = 20_000
+
+KINDS = ("book", "author", "genre")
+_punctuation = re.compile(r"[^\w\s]+")
+_spaces = re.compile(r"\s+")
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKD", text or "")
+    if not text.isascii():
+        text = "".join(char for char in text if not unicodedata.combining(char))
+    return _spaces.sub(" ", _punctuation.sub(" ", text.casefold())).strip()
+
+
+def word_keys(norm):
+    """
+    Keys of a normalized text: the text itself and the text from each later word on.
+    """
+    keys = [norm[:KEY_LENGTH]]
+    start = norm.find(" ")
+    while start != -1 and len(keys) <= MAX_WORDS:
+        keys.append(norm[start + 1:start + 1 + KEY_LENGTH])
+        start = norm.find(" ", start + 1)
+    return keys
+
+
+def background():
+    return getattr(settings, "TYPEAHEAD_BUILD_IN_BACKGROUND", True)
+
+
+class Item:
+    __slots__ = ("ref", "kind", "pk", "label", "score", "author", "genre", "books")
+
+    def __init__(self, ref, kind, pk, label, score=0):
+        self.ref = ref
+        self.kind = kind
+        self.pk = pk
+        self.label = label
+        self.score = score
+        self.author = None  # for books: their author and genre items
+        self.genre = None
+        self.books = 0  # for authors: number of books
+
+    def as_dict(self):
+        return {"type": self.kind, "id": self.pk, "text": self.label, "score": self.score}
+
+
+class PrefixTable:
+    """
+    Sorted keys of one kind with their item refs and a max segment tree of scores.
+    """
+
+    def __init__(self, entries=(), score=None):
+        self.keys = [key for key, _ in entries]
+        self.refs = array("i", (ref for _, ref in entries))
+        self.size = 1 << max(len(self.keys) - 1, 0).bit_length()
+        tree = array("i", [-1]) * (2 * self.size)
+        for position, ref in enumerate(self.refs):
+            tree[self.size + position] = score(ref)
+        for node in range(self.size - 1, 0, -1):
+            tree[node] = max(tree[2 * node], tree[2 * node + 1])
+        self.tree = tree
+        self.pending = []  # sorted (key, ref) not merged yet
+
+    def find(self, key, ref):
+        position = bisect_left(self.keys, key)
+        while position < len(self.keys) and self.keys[position] == key:
+            if self.refs[position] == ref:
+                return position
+            position += 1
+        return None
+
+    def set_score(self, keys, ref, value):
+        tree = self.tree
+        for key in keys:
+            position = self.find(key, ref)
+            if position is None:
+                continue  # in the side list or left out by MAX_ENTRIES
+            node = self.size + position
+            tree[node] = value
+            node >>= 1
+            while node:
+                tree[node] = max(tree[2 * node], tree[2 * node + 1])
+                node >>= 1
+
+    def ranked(self, key, end):
+        """
+        Yields the refs of keys in [key, end) from most to least popular, skipping removed entries.
+        """
+        tree, size, heap = self.tree, self.size, []
+        left, right = bisect_left(self.keys, key) + size, bisect_left(self.keys, end) + size
+        while left < right:
+            if left & 1:
+                heap.append((-tree[left], left))
+                left += 1
+            if right & 1:
+                right -= 1
+                heap.append((-tree[right], right))
+            left >>= 1
+            right >>= 1
+        heapq.heapify(heap)
+        while heap:
+            score, node = heapq.heappop(heap)
+            if score > 0:  # -1 means removed
+                return
+            if node >= size:
+                yield self.refs[node - size]
+            else:
+                heapq.heappush(heap, (-tree[2 * node], 2 * node))
+                heapq.heappush(heap, (-tree[2 * node + 1], 2 * node + 1))
+
+    def pending_refs(self, key, end):
+        return [ref for _, ref in self.pending[bisect_left(self.pending, (key,)):bisect_left(self.pending, (end,))]]
+
+
+class TypeaheadIndex:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.items = []  # position in this list is the item's ref
+        self.books = {}  # book pk -> Item
+        self.genres = {}  # genre pk -> Item
+        self.authors = {}  # normalized author -> Item
+        self.tables = {kind: PrefixTable() for kind in KINDS}
+        self.merging = False
+        self.changed = set()  # refs whose score changed during a merge
+
+    # ---------------- Building ---------------- #
+
+    @classmethod
+    def build(cls):
+        index = cls()
+        loans = dict(
+            BorrowRecord.objects.values_list("book_id").annotate(loans=Count("id")).order_by()
+        )
+        for pk, name in Genre.objects.values_list("id", "name").iterator(chunk_size=5000):
+            index.genres[pk] = index.new_item("genre", pk, name)
+        for pk, title, author, genre_id in Book.objects.values_list(
+            "id", "title", "author", "genre_id"
+        ).iterator(chunk_size=5000):
+            index.link_book(index.new_item("book", pk, title, loans.get(pk, 0)), author, genre_id)
+        index.load()
+        return index
+
+    def load(self):
+        """
+        Builds the tables from all items, within MAX_ENTRIES.
+        """
+        norms = [normalize(item.label) for item in self.items]
+        entries = {kind: [] for kind in KINDS}
+        for item, norm in zip(self.items, norms):
+            entries[item.kind].append((norm[:KEY_LENGTH], item.ref))
+        budget = MAX_ENTRIES - len(self.items)
+        for item in sorted(self.items, key=lambda item: -item.score):
+            if budget <= 0:
+                break
+            extra = word_keys(norms[item.ref])[1:budget + 1]
+            entries[item.kind].extend((key, item.ref) for key in extra)
+            budget -= len(extra)
+        del norms
+        for kind in KINDS:
+            entries[kind].sort()
+            self.tables[kind] = PrefixTable(entries.pop(kind), self.tree_score)
+
+    def new_item(self, kind, pk, label, score=0):
+        item = Item(len(self.items), kind, pk, label, score)
+        self.items.append(item)
+        return item
+
+    def link_book(self, item, author, genre_id):
+        self.books[item.pk] = item
+        norm = normalize(author)
+        if norm not in self.authors:
+            self.authors[norm] = self.new_item("author", None, author)
+        item.author = self.authors[norm]
+        item.genre = self.genres.get(genre_id)
+        for group in (item.author, item.genre):
+            if group is not None:
+                group.books += 1
+                group.score += item.score
+
+    def is_live(self, item):
+        if item.kind == "book":
+            return self.books.get(item.pk) is item
+        if item.kind == "genre":
+            return self.genres.get(item.pk) is item
+        return item.books > 0
+
+    def tree_score(self, ref):
+        item = self.items[ref]
+        return item.score if item is not None and self.is_live(item) else -1
+
+    # ---------------- Updates ---------------- #
+
+    def set_score(self, item, score):
+        """
+        Changes an item's popularity in the tree (-1 once it is removed).
+        """
+        item.score = score
+        if self.merging:
+            self.changed.add(item.ref)
+        self.tables[item.kind].set_score(word_keys(normalize(item.label)), item.ref, self.tree_score(item.ref))
+
+    def add_entries(self, item):
+        table = self.tables[item.kind]
+        for key in word_keys(normalize(item.label)):
+            insort(table.pending, (key, item.ref))
+        if len(table.pending) > MERGE_AFTER and not self.merging:
+            self.merging = True
+            if background():
+                threading.Thread(target=self.merge, args=(item.kind,), name="typeahead-merge", daemon=True).start()
+            else:
+                self.merge(item.kind)
+
+    def merge(self, kind):
+        """
+        Merges the side list into the main arrays of one kind and drops removed
+        entries. The slow part runs without the lock; score changes made
+        meanwhile are replayed on the new arrays.
+        """
+        try:
+            table = self.tables[kind]
+            with self.lock:
+                pending = table.pending[:]
+            entries = [
+                (key, ref) for key, ref in heapq.merge(zip(table.keys, table.refs), pending)
+                if self.tree_score(ref) >= 0
+            ]
+            merged = PrefixTable(entries, self.tree_score)
+            with self.lock:
+                merged.pending = sorted(set(table.pending) - set(pending))
+                self.tables[kind] = merged
+                for ref in self.changed:
+                    item = self.items[ref]
+                    if item is not None and item.kind == kind:
+                        merged.set_score(word_keys(normalize(item.label)), ref, self.tree_score(ref))
+                # let go of removed items no table refers to any more
+                if kind == "author":
+                    self.authors = {norm: item for norm, item in self.authors.items() if item.books > 0}
+                kept = {ref for _, ref in merged.pending}
+                for ref, item in enumerate(self.items):
+                    if item is not None and item.kind == kind and ref not in kept and not self.is_live(item):
+                        self.items[ref] = None
+        finally:
+            self.changed = set()
+            self.merging = False
+
+    def book_saved(self, pk, title, author, genre_id):
+        with self.lock:
+            old = self.books.get(pk)
+            if old is not None and old.label == title and old.author.label == author and (
+                old.genre is self.genres.get(genre_id)
+            ):
+                return
+            score = self.book_deleted(pk)
+            item = self.new_item("book", pk, title, score)
+            new_author = normalize(author) not in self.authors
+            self.link_book(item, author, genre_id)
+            if new_author:
+                self.add_entries(item.author)
+            for group in (item.author, item.genre):
+                if group is not None:
+                    self.set_score(group, group.score)
+            self.add_entries(item)
+
+    def book_deleted(self, pk):
+        """
+        Removes a book, returns its score.
+        """
+        with self.lock:
+            item = self.books.pop(pk, None)
+            if item is None:
+                return 0
+            self.set_score(item, item.score)
+            for group in (item.author, item.genre):
+                if group is not None:
+                    group.books -= 1
+                    self.set_score(group, group.score - item.score)
+            return item.score
+
+    def genre_saved(self, pk, name):
+        with self.lock:
+            old = self.genres.get(pk)
+            if old is not None and old.label == name:
+                return
+            item = self.genres[pk] = self.new_item("genre", pk, name)
+            if old is not None:
+                item.score = old.score
+                self.set_score(old, old.score)
+                for book in self.books.values():
+                    if book.genre is old:
+                        book.genre = item
+            self.add_entries(item)
+
+    def genre_deleted(self, pk):
+        with self.lock:
+            item = self.genres.pop(pk, None)
+            if item is not None:
+                self.set_score(item, item.score)
+
+    def loan_created(self, book_id):
+        with self.lock:
+            item = self.books.get(book_id)
+            if item is None:
+                return
+            for target in (item, item.author, item.genre):
+                if target is not None:
+                    self.set_score(target, target.score + 1)
+
+    # ---------------- Lookups ---------------- #
+
+    def search(self, query, limit=10, kinds=KINDS):
+        query = normalize(query)
+        if not query:
+            return []
+        key = query[:KEY_LENGTH]
+        end = key + "\U0010ffff"
+
+        def matches(item):
+            if len(query) <= KEY_LENGTH:
+                return True
+            norm = normalize(item.label)
+            return norm.startswith(query) or f" {query}" in norm
+
+        with self.lock:
+            found = {}
+            for kind in kinds:
+                table, count = self.tables[kind], 0
+                for ref in table.ranked(key, end):
+                    item = self.items[ref]
+                    if ref not in found and matches(item):
+                        found[ref] = item
+                        count += 1
+                        if count >= limit:
+                            break
+                for ref in table.pending_refs(key, end):
+                    item = self.items[ref]
+                    if self.is_live(item) and matches(item):
+                        found[ref] = item
+            results = sorted(found.values(), key=lambda item: (-item.score, item.label))[:limit]
+            return [item.as_dict() for item in results]
+
+
+_index = None
+_building = threading.Lock()
+
+
+def get_index(wait=None):
+    """
+    Returns the index, or None while it is still being built in the background.
+    """
+    global _index
+    if _index is not None:
+        return _index
+    if wait is None:
+        wait = not background()
+    if wait:
+        with _building:
+            if _index is None:
+                _index = TypeaheadIndex.build()
+        return _index
+    if _building.acquire(blocking=False):
+        threading.Thread(target=_build_in_background, name="typeahead-build", daemon=True).start()
+    return None
+
+
+def _build_in_background():
+    global _index
+    from django.db import close_old_connections
+
+    try:
+        if _index is None:
+            _index = TypeaheadIndex.build()
+    finally:
+        close_old_connections()
+        _building.release()
+
+
+def reset():
+    global _index
+    _index = None
+
+
+def database_search(query, limit=10, kinds=KINDS):
+    """
+    Fallback used until the index is ready: title prefix matches from the database.
+    """
+    if "book" not in kinds:
+        return []
+    books = Book.objects.filter(title__istartswith=query).values_list("id", "title")[:limit]
+    return [{"type": "book", "id": pk, "text": title, "score": None} for pk, title in books]
+
+
+# Called by the model signals once a change is committed. They do nothing
+# until the index exists; the first build reads the committed data anyway.
+
+def book_saved(book):
+    if _index is not None:
+        _index.book_saved(book.pk, book.title, book.author, book.genre_id)
+
+
+def book_deleted(book):
+    if _index is not None:
+        _index.book_deleted(book.pk)
+
+
+def genre_saved(genre):
+    if _index is not None:
+        _index.genre_saved(genre.pk, genre.name)
+
+
+def genre_deleted(genre):
+    if _index is not None:
+        _index.genre_deleted(genre.pk)
+
+
+def loan_created(record):
+    if _index is not None:
+        _index.loan_created(record.book_id)
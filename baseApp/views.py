@@ -1,28 +1,109 @@
 from django.shortcuts import render
-from .models import Genre, Book, BorrowRecord
+from .models import (
+    Genre,
+    Book,
+    BorrowRecord,
+    ArchivedBorrowRecord,
+    Reservation,
+    ChangeLog,
+    FineRule,
+    BookRecommendation,
+    ACTIVE_STATUSES,
+)
+from . import availability, fines, logins, typeahead
+from .idempotency import idempotent
 from rest_framework.viewsets import ModelViewSet, GenericViewSet, ReadOnlyModelViewSet
 from rest_framework import status, filters
 from rest_framework.response import Response
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
 from .serializers import (
     GenreSerializer,
     BookSerializer,
+    BookInventorySerializer,
     BorrowRecordSerializer,
     UserSerializer,
     LoginSerializer,
     GroupSerializer,
-    MemberSerializer
+    MemberSerializer,
+    ReservationSerializer,
+    ChangeLogSerializer,
+    FineRuleSerializer,
+    BookRecommendationSerializer,
+    LoanHistorySerializer,
 )
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.db.models import BooleanField, F, Value
+from django.http import JsonResponse
 from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
 from django.contrib.auth.models import User, Group
-from django.contrib.auth import authenticate
-from rest_framework.authtoken.models import Token
 from rest_framework.permissions import IsAuthenticated, DjangoModelPermissions
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ParseError, ValidationError
 from django_filters.rest_framework import DjangoFilterBackend
 
 
-class GenreApiViewSet(ModelViewSet):
+class SparseFieldsMixin:
+    """
+    ?fields=id,title on a read action returns only those fields,
+    and the query only selects their columns (and joins).
+    """
+    sparse_actions = ("list", "retrieve")
+
+    def sparse_fields(self):
+        """
+        The requested serializer fields by name, or None for all of them.
+        """
+        if not hasattr(self, "_sparse_fields"):
+            self._sparse_fields = None
+            param = self.request.query_params.get("fields", "") if self.action in self.sparse_actions else ""
+            names = [name.strip() for name in param.split(",") if name.strip()]
+            if names:
+                available = self.get_serializer_class()().fields
+                unknown = [name for name in names if name not in available]
+                if unknown:
+                    raise ValidationError(
+                        {"fields": f"Unknown fields: {', '.join(unknown)}. Choose from {', '.join(available)}."}
+                    )
+                self._sparse_fields = {name: available[name] for name in names}
+        return self._sparse_fields
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.sparse_fields()
+        if fields is not None:
+            kwargs["fields"] = list(fields)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.sparse_fields()
+        if fields is None:
+            return queryset
+        columns, joins = [queryset.model._meta.pk.name], []
+        for field in fields.values():
+            model = queryset.model
+            try:
+                for attr in field.source_attrs[:-1]:
+                    model = model._meta.get_field(attr).related_model
+                model._meta.get_field(field.source_attrs[-1])
+            except (FieldDoesNotExist, AttributeError, IndexError):
+                return queryset  # not a plain column, load everything
+            columns.append("__".join(field.source_attrs))
+            if len(field.source_attrs) > 1:
+                joins.append("__".join(field.source_attrs[:-1]))
+        return queryset.select_related(None).select_related(*joins).only(*columns)
+
+
+class GenreApiViewSet(SparseFieldsMixin, ModelViewSet):
     queryset = Genre.objects.all()
     serializer_class = GenreSerializer
     permission_classes = [DjangoModelPermissions]
@@ -33,7 +114,7 @@ class PaginationViewSet(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
-class BookAPiViewSet(ModelViewSet):
+class BookAPiViewSet(SparseFieldsMixin, ModelViewSet):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
     permission_classes = [DjangoModelPermissions]
@@ -45,11 +126,142 @@ class BookAPiViewSet(ModelViewSet):
     search_fields = ["title", "author", "genre__name"]
     filterset_fields = ["genre__name"]
 
+    max_lookup = 500
+    max_suggestions = 25
+    max_inventory = 10000
+
+    def get_permissions(self):
+        # a bulk lookup only reads, even when it is sent as a POST
+        if self.action == "availability":
+            return [IsAuthenticated()]
+        return super().get_permissions()
+
+    def availability(self, request):
+        """
+        Custom endpoint: GET /books/availability/?isbns=...&ids=...
+        or POST /books/availability/ with {"isbns": [...], "ids": [...]}
+        Returns available_copies/total_copies of many books at once, from the
+        availability cache or a single indexed query for the cache misses.
+        """
+        if request.method == "POST":
+            isbns = request.data.get("isbns") or []
+            ids = request.data.get("ids") or []
+        else:
+            isbns = [isbn for isbn in request.query_params.get("isbns", "").split(",") if isbn]
+            ids = [book_id for book_id in request.query_params.get("ids", "").split(",") if book_id]
+        if not isinstance(isbns, list) or not isinstance(ids, list):
+            raise ValidationError({"detail": "isbns and ids must be lists."})
+        try:
+            ids = [int(book_id) for book_id in ids]
+        except (TypeError, ValueError):
+            raise ValidationError({"ids": "ids must be integers."})
+        isbns = [str(isbn) for isbn in isbns]
+        if len(ids) + len(isbns) > self.max_lookup:
+            raise ValidationError({"detail": f"At most {self.max_lookup} books per lookup."})
+
+        found = availability.lookup(ids=ids, isbns=isbns)
+        results, seen = [], set()
+        for row in [*found["ids"].values(), *found["isbns"].values()]:
+            if row[0] not in seen:
+                seen.add(row[0])
+                results.append(dict(zip(availability.FIELDS, row)))
+        return Response(
+            {
+                "results": results,
+                "missing": {
+                    "ids": [book_id for book_id in ids if book_id not in found["ids"]],
+                    "isbns": [isbn for isbn in isbns if isbn not in found["isbns"]],
+                },
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    def inventory(self, request):
+        """
+        Custom endpoint: PATCH /books/inventory/
+        {"books": [{"id": 1, "total_copies": 12}, {"id": 2, "available_copies_delta": -1}, ...]}
+        Applies stock-taking counts (or deltas) to many books in one
+        transaction, with one UPDATE per 500 books (Book.update_inventory).
+        If a book is missing or would break available <= total, nothing is changed.
+        """
+        lines = request.data.get("books")
+        if not isinstance(lines, list) or not lines:
+            raise ValidationError({"books": "Send a non-empty list of books."})
+        if len(lines) > self.max_inventory:
+            raise ValidationError({"books": f"At most {self.max_inventory} books per update."})
+        serializer = BookInventorySerializer(data=lines, many=True)
+        serializer.is_valid(raise_exception=True)
+        changes = {line["id"]: line["changes"] for line in serializer.validated_data}
+        if len(changes) != len(lines):
+            raise ValidationError({"books": "Each book may appear only once."})
+
+        updated, missing, invalid = Book.update_inventory(changes)
+        if missing or invalid:
+            # a Response rather than ValidationError, which would turn the ids into strings
+            return Response(
+                {
+                    "detail": "Nothing was changed. Books must exist, copies cannot be negative "
+                              "and available copies cannot exceed total copies.",
+                    "missing": missing,
+                    "invalid": invalid,
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        transaction.on_commit(lambda: availability.refresh(updated))
+        return Response({"updated": len(updated)}, status=status.HTTP_200_OK)
+
+    def typeahead(self, request):
+        """
+        Custom endpoint: GET /books/typeahead/?q=<prefix>&types=book,author,genre&limit=10
+        Suggestions for the search box from the in-memory prefix index
+        (baseApp/typeahead.py), most borrowed first. While the index is
+        still being built, titles starting with q come from the database.
+        """
+        query = request.query_params.get("q", "")
+        kinds = tuple(kind for kind in request.query_params.get("types", "").split(",") if kind) or typeahead.KINDS
+        if set(kinds) - set(typeahead.KINDS):
+            raise ValidationError({"types": f"Choose from {', '.join(typeahead.KINDS)}."})
+        try:
+            limit = min(int(request.query_params.get("limit", 10)), self.max_suggestions)
+        except ValueError:
+            raise ValidationError({"limit": "limit must be an integer."})
+        if limit < 1:
+            raise ValidationError({"limit": "limit must be at least 1."})
+
+        index = typeahead.get_index()
+        if index is None:
+            results = typeahead.database_search(query, limit, kinds) if query.strip() else []
+        else:
+            results = index.search(query, limit, kinds)
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+    def recommendations(self, request, pk=None):
+        """
+        Custom endpoint: GET /books/{id}/recommendations/?limit=10
+        "Patrons also borrowed": the books most often borrowed by the same
+        members, precomputed by manage.py build_recommendations. One indexed
+        read; a book without recommendations gives an empty list.
+        """
+        try:
+            limit = min(int(request.query_params.get("limit", 10)), self.max_suggestions)
+        except ValueError:
+            raise ValidationError({"limit": "limit must be an integer."})
+        if limit < 1:
+            raise ValidationError({"limit": "limit must be at least 1."})
+        neighbours = (
+            BookRecommendation.objects.filter(book_id=pk)
+            .select_related("recommended")
+            .order_by("rank")[:limit]
+        )
+        return Response(
+            BookRecommendationSerializer(neighbours, many=True).data, status=status.HTTP_200_OK
+        )
+
 
 
 
 
-class BorrowRecordViewSet(ModelViewSet):
+class BorrowRecordViewSet(SparseFieldsMixin, ModelViewSet):
     """
     API endpoint to manage borrowing records.
     - Provides default CRUD operations (list, retrieve, create, update, delete)
@@ -76,18 +288,68 @@ class BorrowRecordViewSet(ModelViewSet):
     # Allow ordering (sorting) by due_date or borrow_date
     ordering_fields = ["borrow_date", "due_date", "status"]
     ordering = ["-borrow_date"]  # default ordering
+    sparse_actions = ("list", "retrieve", "overdue")
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
 
+    def perform_create(self, serializer):
+        """
+        Lending a book takes one of its available copies.
+        The book row is locked so two loans cannot take the last copy.
+        """
+        with transaction.atomic():
+            book = Book.objects.select_for_update().get(pk=serializer.validated_data["book"].pk)
+            if book.available_copies < 1:
+                raise ValidationError({"book": "No copies available, place a hold instead."})
+            book.available_copies -= 1
+            book.save()
+            serializer.save(book=book)
+
+    def perform_update(self, serializer):
+        """
+        Moving an active loan to another book takes a copy of the new book
+        and frees the copy of the old one, with the loan and both books locked.
+        """
+        with transaction.atomic():
+            record = BorrowRecord.objects.select_for_update().get(pk=serializer.instance.pk)
+            new_book = serializer.validated_data.get("book")
+            if record.status not in ACTIVE_STATUSES or new_book is None or new_book.pk == record.book_id:
+                serializer.save()
+                return
+            # Locked in id order, so two loans moved in opposite directions cannot deadlock
+            locked = Book.objects.select_for_update().filter(pk__in=[record.book_id, new_book.pk])
+            books = {book.pk: book for book in locked.order_by("pk")}
+            new_book = books[new_book.pk]
+            if new_book.available_copies < 1:
+                raise ValidationError({"book": "No copies available, place a hold instead."})
+            new_book.available_copies -= 1
+            new_book.save()
+            serializer.save(book=new_book)
+            BorrowRecord.free_copy(books[record.book_id])
+
+    def perform_destroy(self, instance):
+        """
+        Deleting an active loan frees its copy, as a return would.
+        """
+        with transaction.atomic():
+            record = BorrowRecord.objects.select_for_update().get(pk=instance.pk)
+            if record.status in ACTIVE_STATUSES:
+                BorrowRecord.free_copy(Book.objects.select_for_update().get(pk=record.book_id))
+            record.delete()
 
     # ---------------- Custom Actions ---------------- #
 
+    @idempotent
     def mark_as_returned(self, request, pk=None):
         """
         Custom endpoint: POST /borrow-records/{id}/mark_as_returned/
         Marks the specific borrow record as returned:
         - Updates status = RETURNED
         - Sets return_date = today
-        - Increases book.available_copies by 1
+        - Lends the copy to the first waiting hold, or
+          increases book.available_copies by 1 if nobody is waiting
         """
         record = self.get_object()  # fetch the BorrowRecord by id
         record.mark_as_returned()  # call model method
@@ -111,11 +373,172 @@ class BorrowRecordViewSet(ModelViewSet):
         Fetches all borrow records where status = OVERDUE
         Useful for librarians/admins to track pending books.
         """
-        today = timezone.now().date()
-        overdue_records = BorrowRecord.objects.filter(status="OVERDUE")
+        # get_queryset() keeps the select_related, so book_title does not cost a query per record
+        overdue_records = self.get_queryset().filter(status="OVERDUE")
         serializer = self.get_serializer(overdue_records, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    def history(self, request):
+        """
+        Custom endpoint: GET /borrow-records/history/?member=<id>&book=<id>
+        Loans from both the BorrowRecord table and the archive of old
+        returned loans (see ArchivedBorrowRecord), newest first, paginated.
+        The other endpoints only see the BorrowRecord table.
+        """
+        lookup = {}
+        for name in ("member", "book"):
+            if request.query_params.get(name):
+                try:
+                    lookup[f"{name}_id"] = int(request.query_params[name])
+                except ValueError:
+                    raise ValidationError({name: f"{name} must be an id."})
+
+        def loans(model, archived):
+            return model.objects.filter(**lookup).values(
+                *ArchivedBorrowRecord.FIELDS,
+                book_title=F("book__title"),
+                archived=Value(archived, output_field=BooleanField()),
+            )
+
+        history = loans(BorrowRecord, False).union(loans(ArchivedBorrowRecord, True), all=True)
+        page = self.paginate_queryset(history.order_by("-borrow_date", "-id"))
+        return self.get_paginated_response(LoanHistorySerializer(page, many=True).data)
+
+class ReservationViewSet(ModelViewSet):
+    """
+    API endpoint for holds on books with no available copies.
+    - POST adds the member (default: the logged-in user) to the end of the book's queue
+    - DELETE cancels the hold
+    - Holds are served first come, first served when a copy is returned
+    """
+    queryset = Reservation.objects.all().select_related("book")
+    serializer_class = ReservationSerializer
+    permission_classes = [DjangoModelPermissions]
+    http_method_names = ["get", "post", "delete", "head", "options"]
+
+    pagination_class = PaginationViewSet
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ["book", "member", "status"]
+    ordering_fields = ["created_at", "position"]
+    ordering = ["book", "position"]
+
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        member = data.get("member") or self.request.user
+        if Reservation.objects.waiting().filter(book=data["book"], member=member).exists():
+            raise ValidationError({"book": "This member is already waiting for this book."})
+        serializer.instance = Reservation.place(data["book"], member)
+
+    def perform_destroy(self, instance):
+        # Keep the row for history, it just leaves the queue
+        if instance.status == "WAITING":
+            instance.status = "CANCELLED"
+            instance.save()
+
+    def position(self, request, pk=None):
+        """
+        Custom endpoint: GET /holds/{id}/position/
+        Returns the hold's place in its book's queue (1 = next in line),
+        or null if the hold is no longer waiting.
+        """
+        hold = self.get_object()
+        return Response(
+            {"id": hold.id, "book": hold.book_id, "status": hold.status, "position": hold.queue_position()},
+            status=status.HTTP_200_OK,
+        )
+
+
+class ChangeFeedViewSet(GenericViewSet):
+    """
+    API endpoint for incremental sync of genres, books and borrow records.
+    GET /changes/?since=<cursor>&limit=<n> returns the changes after the cursor,
+    oldest first. Clients store next_cursor and ask again while has_more is true.
+    The query is a primary key range scan, so it costs as much as the number
+    of changes returned, not the size of the tables.
+
+    Ids are handed out when a row is inserted, not when its transaction
+    commits, so an entry with a lower id can appear after a higher one was
+    read. next_cursor therefore only moves past entries older than
+    settings.CHANGE_FEED_SETTLE_SECONDS; newer ones are sent again on the
+    next request, and applying an entry twice leaves the same state.
+    """
+    queryset = ChangeLog.objects.all()
+    serializer_class = ChangeLogSerializer
+    permission_classes = [DjangoModelPermissions]
+
+    default_limit = 500
+    max_limit = 5000
+
+    def list(self, request):
+        try:
+            since = int(request.query_params.get("since", 0))
+            limit = min(int(request.query_params.get("limit", self.default_limit)), self.max_limit)
+        except ValueError:
+            raise ValidationError({"since": "since and limit must be integers."})
+        if limit < 1:
+            raise ValidationError({"limit": "limit must be at least 1."})
+
+        changes = ChangeLog.objects.filter(id__gt=since)
+        if request.query_params.get("model"):
+            changes = changes.filter(model__in=request.query_params["model"].split(","))
+        # one extra row tells whether there is another page
+        changes = list(changes.order_by("id")[:limit + 1])
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+
+        settled = timezone.now() - timedelta(seconds=settings.CHANGE_FEED_SETTLE_SECONDS)
+        next_cursor = since
+        for change in changes:
+            if change.created_at > settled:
+                break
+            next_cursor = change.id
+        return Response(
+            {
+                "results": self.get_serializer(changes, many=True).data,
+                "next_cursor": next_cursor,
+                # nothing settled yet: asking again right away would return the same page
+                "has_more": has_more and next_cursor != since,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class FineRuleViewSet(ModelViewSet):
+    """
+    API endpoint to manage late fee rules per genre.
+    Genres without a rule use settings.FINE_DEFAULT_RULE.
+    """
+    queryset = FineRule.objects.all().select_related("genre").order_by("id")
+    serializer_class = FineRuleSerializer
+    permission_classes = [DjangoModelPermissions]
+
+
+class FineViewSet(GenericViewSet):
+    """
+    API endpoint for outstanding late fees of open loans.
+    - GET /fines/ lists member balances, highest first
+    - GET /fines/members/{id}/ returns a member's balance with a line per loan
+    - GET /fines/records/{id}/ returns the fine of one loan
+    All fines are computed together once a day (see baseApp/fines.py),
+    so these only read the cached result. Amounts are decimal strings.
+    """
+    queryset = BorrowRecord.objects.all()
+    permission_classes = [DjangoModelPermissions]
+    pagination_class = PaginationViewSet
+
+    def list(self, request):
+        snapshot = fines.current()
+        page = self.paginate_queryset(snapshot.balance_list())
+        return self.get_paginated_response(page)
+
+    def member(self, request, pk=None):
+        snapshot = fines.current()
+        return Response({"date": snapshot.day, **snapshot.for_member(int(pk))}, status=status.HTTP_200_OK)
+
+    def record(self, request, pk=None):
+        snapshot = fines.current()
+        return Response({"date": snapshot.day, **snapshot.for_record(int(pk))}, status=status.HTTP_200_OK)
+
 
 # Model for Auhthentication
 class UserApiView(GenreApiViewSet):
@@ -127,6 +550,7 @@ class UserApiView(GenreApiViewSet):
     )  # No authentication required for this view and from setting above all views require authentication
 
     # for register
+    @idempotent
     def register(self, request):
         """
         Custom endpoint: POST /register/
@@ -143,41 +567,61 @@ class UserApiView(GenreApiViewSet):
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    # for login
-    def login(self, request):
-        """
-        Custom endpoint: POST /login/
-        Authenticates a user:
-        - Accepts username and password
-        - Returns user details if credentials are valid
-        - Returns error if invalid credentials
-        """
-        serializer = LoginSerializer(data=request.data)
-        if serializer.is_valid():
-            username = serializer.validated_data.get("username")
-            password = serializer.validated_data.get("password")
-
-            user = authenticate(username=username, password=password)
-            print(user)
-
-            if user is None:
-                return Response(
-                    {"error": "Invalid credentials"},
-                    status=status.HTTP_401_UNAUTHORIZED,
-                )
-            else:
-                token, _ = Token.objects.get_or_create(user=user)
-
-                return Response(
-                    {
-                        "token": token.key,
-                        "username": user.username,
-                        "email": user.email,
-                    },
-                )
-        else:
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        
+
+# for login
+@csrf_exempt
+@require_POST
+async def login(request):
+    """
+    Custom endpoint: POST /login/
+    Authenticates a user:
+    - Accepts username and password
+    - Returns user details if credentials are valid
+    - Returns error if invalid credentials
+    - Refuses a username with too many recent failures before hashing,
+      and sheds load when too many password checks are waiting (baseApp/logins.py)
+    A plain async Django view, as DRF views are sync only: the password
+    check is awaited on a thread of its own instead of blocking the worker.
+    """
+    try:
+        data = Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES]).data
+    except ParseError as exc:
+        return JsonResponse({"detail": exc.detail}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = LoginSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    username = serializer.validated_data.get("username")
+    password = serializer.validated_data.get("password")
+
+    user, wait = await logins.login(request, username, password)
+    if wait:
+        response = JsonResponse(
+            {"error": "Too many failed attempts, try again later."},
+            status=status.HTTP_429_TOO_MANY_REQUESTS,
+        )
+        response["Retry-After"] = str(wait)
+        return response
+    if user is None:
+        response = JsonResponse(
+            {"error": "Too many logins at once, try again."},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+        response["Retry-After"] = "1"
+        return response
+    if user is False:
+        return JsonResponse(
+            {"error": "Invalid credentials"},
+            status=status.HTTP_401_UNAUTHORIZED,
+        )
+    return JsonResponse(
+        {
+            "token": await sync_to_async(logins.token_for)(user),
+            "username": user.username,
+            "email": user.email,
+        },
+    )
+
+
 class GroupApiViewSet(ReadOnlyModelViewSet):
     """
     API endpoint to manage user groups.
@@ -188,7 +632,7 @@ class GroupApiViewSet(ReadOnlyModelViewSet):
     permission_classes = [DjangoModelPermissions]
 
 
-class MemberApiViewSet(ReadOnlyModelViewSet):
+class MemberApiViewSet(SparseFieldsMixin, ReadOnlyModelViewSet):
     """
     API endpoint to list all members.
     Only users in the "Member" group will be included.
@@ -197,12 +641,9 @@ class MemberApiViewSet(ReadOnlyModelViewSet):
     permission_classes = [DjangoModelPermissions]
 
     def get_queryset(self):
-        try:
-            member_group = Group.objects.get(name="member")
-            users = User.objects.filter(groups=member_group)
-            return users
-        except Group.DoesNotExist:
-            return User.objects.none()
+        # Filtering through the join saves the separate Group lookup on every request;
+        # a missing "member" group simply gives an empty list.
+        return User.objects.filter(groups__name="member").order_by("id")
 
 
 